@@ -21,7 +21,7 @@ bl_info = {
     "name": "Create spider webs",
     "author": "Jasper van Nieuwenhuizen",
     "version": (0, 1),
-    "blender": (2, 7, 5),
+    "blender": (2, 76, 0),
     "location": "View3D > Add > Curve ",
     "description": "Create spider webs or wires between objects",
     "warning": "wip",
@@ -20,21 +20,34 @@
 # Import modules.
 if "bpy" in locals():
     import importlib
+    if "random_tools" in locals():
+        importlib.reload(random_tools)
     if "mesh_tools" in locals():
         importlib.reload(mesh_tools)
     if "curve_tools" in locals():
         importlib.reload(curve_tools)
+    if "strand_tools" in locals():
+        importlib.reload(strand_tools)
 else:
+    from . import random_tools
     from . import mesh_tools
     from . import curve_tools
+    from . import strand_tools
 
-import itertools
-import random
+import time
+import numpy
 import bpy
 from bpy.props import (IntProperty,
                        FloatProperty,
                        BoolProperty,
-                       EnumProperty)
+                       EnumProperty,
+                       StringProperty)
+
+
+# The results of the stages of the last created web (see Spiderweb.execute),
+# by stage name: the key of the settings and objects they depend on and the
+# results.
+STAGE_CACHE = {}
 
 
 class Spiderweb(bpy.types.Operator):
@@ -43,11 +56,13 @@ class Spiderweb(bpy.types.Operator):
     bl_label = "Create spiderweb"
     bl_options = {'REGISTER', 'UNDO', 'PRESET'}
 
-    def __init__(self):
-        # Because creating a lot of wires can take some time and slow down the
-        # viewport, set the initial amount of wires to 50 if it is higher.
-        if self.amount > 50:
-            self.amount = 50
+    # When invoked, the web is created in steps of at most modal_chunk_size
+    # strands, for modal_step_time seconds per timer event (see modal).
+    # Building the objects at the end takes modal_build_share of the
+    # progress (unless the strands are added to the web right away).
+    modal_chunk_size = 8192
+    modal_step_time = 0.1
+    modal_build_share = 0.2
 
     amount = IntProperty(name="Amount",
                          description="The number of wires to create",
@@ -60,6 +75,28 @@ class Spiderweb(bpy.types.Operator):
                                   default=1,
                                   min=1,
                                   max=100)
+    pairing_items = [('RANDOM', 'Random', 'Connect the end points to random '
+                                          'other end points'),
+                     ('NEAREST', 'Nearest', 'Connect the end points to one '
+                                            'of their nearest end points on '
+                                            'other objects')]
+    pairing = EnumProperty(name="Pairing",
+                           description="Which end points to connect",
+                           items=pairing_items,
+                           default='RANDOM')
+    neighbours = IntProperty(name="Neighbours",
+                             description="The number of nearest end points "
+                                         "to pick from",
+                             default=8,
+                             min=1,
+                             max=256)
+    max_length = FloatProperty(name="Max length",
+                               description="The maximum length of the main "
+                                           "strands (0 is no maximum)",
+                               default=0.0,
+                               min=0.0,
+                               soft_max=100.0,
+                               step=10)
     include_sub = BoolProperty(name="Recursive sub strands",
                                description="Sub strands will also be "
                                            "generated between already"
@@ -71,11 +108,25 @@ class Spiderweb(bpy.types.Operator):
                                  min=0,
                                  max=999999,
                                  soft_max=100)
+    max_strands = IntProperty(name="Max strands",
+                              description="Stop creating strands when the "
+                                          "web has this many strands",
+                              default=1000000,
+                              min=2,
+                              max=999999999)
+    max_memory = IntProperty(name="Max memory (MB)",
+                             description="Stop creating strands when they "
+                                         "take this much memory",
+                             default=1024,
+                             min=1,
+                             max=1048576)
     method_items = [('PIVOT', 'Pivot', 'Sample from pivot points (Will not '
                                        'return more points then the number '
                                        'of selected objects'),
                     ('VOLUME', 'Volume', 'Sample from the volume(s)'),
                     ('SURFACE', 'Surface', 'Sample from surface(s)'),
+                    ('POISSON', 'Poisson disk', 'Sample evenly spread points '
+                                                'from surface(s)'),
                     ('EDGES', 'Edges', 'Sample from edges'),
                     ('VERTS', 'Vertices', 'Sample from vertices')]
     method = EnumProperty(name="Method",
@@ -83,11 +134,52 @@ class Spiderweb(bpy.types.Operator):
                                       "curves from",
                           items=method_items,
                           default='SURFACE')
+    min_distance = FloatProperty(name="Min distance",
+                                 description="The minimum distance between "
+                                             "the end points (0 derives it "
+                                             "from the amount)",
+                                 default=0.0,
+                                 min=0.0,
+                                 soft_max=10.0,
+                                 step=1)
+    density_items = [('NONE', 'None', 'Spread the end points evenly'),
+                     ('VERTEX_GROUP', 'Vertex group', 'Weight the end '
+                                                      'points by a vertex '
+                                                      'group'),
+                     ('ATTRIBUTE', 'Face attribute', 'Weight the end points '
+                                                     'by a float face '
+                                                     'layer')]
+    density_source = EnumProperty(name="Density",
+                                  description="Where to get the density of "
+                                              "the end points from (only "
+                                              "for surface and poisson "
+                                              "sampling)",
+                                  items=density_items,
+                                  default='NONE')
+    density_name = StringProperty(name="Name",
+                                  description="The name of the vertex group "
+                                              "or face layer with the "
+                                              "density",
+                                  default="")
     seed = IntProperty(name="Seed",
                        description="The seed to use for the generation "
                                    "(change it to get a different variant "
                                    "of the web)",
                        default=0)
+    threads = IntProperty(name="Threads",
+                          description="The number of threads to sample the "
+                                      "objects with (0 uses all cpus)",
+                          default=0,
+                          min=0,
+                          max=64)
+    drape_items = [('OFFSET', 'Offset', 'Move the middle of every strand '
+                                        'down by a random drape'),
+                   ('CATENARY', 'Catenary', 'Let every strand hang as a '
+                                            'catenary with a random slack')]
+    drape_mode = EnumProperty(name="Drape",
+                              description="How the strands hang",
+                              items=drape_items,
+                              default='OFFSET')
     drape_min = FloatProperty(name="Drape min",
                               description="The minimum drape of the strands",
                               default=-1.0,
@@ -105,10 +197,110 @@ class Spiderweb(bpy.types.Operator):
                                              "dependent on the length of "
                                              "the strand",
                                  default=True)
+    slack_min = FloatProperty(name="Slack min",
+                              description="The minimum length of the "
+                                          "strands, relative to the "
+                                          "distance between their ends",
+                              default=1.0,
+                              min=1.0,
+                              soft_max=2.0,
+                              step=1)
+    slack_max = FloatProperty(name="Slack max",
+                              description="The maximum length of the "
+                                          "strands, relative to the "
+                                          "distance between their ends",
+                              default=1.1,
+                              min=1.0,
+                              soft_max=2.0,
+                              step=1)
+    point_count = IntProperty(name="Points",
+                              description="The number of control points "
+                                          "per strand",
+                              default=7,
+                              min=3,
+                              max=64)
+    adaptive_resolution = BoolProperty(name="Adaptive resolution",
+                                       description="Pick the resolution of "
+                                                   "every strand from its "
+                                                   "length and drape, "
+                                                   "instead of using 12 for "
+                                                   "all strands",
+                                       default=False)
+    tolerance = FloatProperty(name="Tolerance",
+                              description="The maximum distance between the "
+                                          "displayed and the real strand "
+                                          "(for adaptive resolution)",
+                              default=0.001,
+                              min=0.00001,
+                              soft_max=0.1,
+                              step=0.01,
+                              precision=4)
+    collision_items = [('NONE', 'None', 'Strands may pass through the '
+                                        'objects'),
+                       ('REJECT', 'Reject', 'Leave out strands that pass '
+                                            'through the objects'),
+                       ('RESAMPLE', 'Resample', 'Replace strands that pass '
+                                                'through the objects by '
+                                                'new ones')]
+    collision = EnumProperty(name="Collision",
+                             description="What to do with strands that "
+                                         "pass through the objects",
+                             items=collision_items,
+                             default='NONE')
+    collide_scene = BoolProperty(name="Scene objects",
+                                 description="Also test against all "
+                                             "visible meshes in the scene, "
+                                             "not only the selected objects",
+                                 default=False)
+    attempts = IntProperty(name="Attempts",
+                           description="How many times a colliding strand "
+                                       "is replaced",
+                           default=4,
+                           min=1,
+                           max=100)
+    output_items = [('CURVE', 'Curve', 'Create a curve with a NURBS spline '
+                                       'per strand'),
+                    ('MESH', 'Mesh', 'Create a mesh with only edges (much '
+                                     'lighter for very large webs)')]
+    output = EnumProperty(name="Output",
+                          description="The type of object to create",
+                          items=output_items,
+                          default='CURVE')
+    use_wire_material = BoolProperty(name="Wire material",
+                                     description="Render the edges of the "
+                                                 "mesh as wires (Blender "
+                                                 "Internal)",
+                                     default=False)
+    shard_items = [('NONE', 'None', 'Create a single object'),
+                   ('GRID', 'Grid', 'Split the web in a grid of objects'),
+                   ('COUNT', 'Count', 'Split the web in objects with a '
+                                      'maximum number of strands')]
+    shard_method = EnumProperty(name="Shards",
+                                description="Split the web over multiple "
+                                            "objects (parented to an empty), "
+                                            "so parts of it can be evaluated, "
+                                            "hidden or edited on their own",
+                                items=shard_items,
+                                default='NONE')
+    shard_grid = IntProperty(name="Grid size",
+                             description="The number of shards per axis",
+                             default=2,
+                             min=1,
+                             max=64)
+    shard_size = IntProperty(name="Strands per shard",
+                             description="The maximum number of strands "
+                                         "per shard",
+                             default=10000,
+                             min=1,
+                             max=9999999)
+    keep_partial = BoolProperty(name="Keep on cancel",
+                                description="Create the web from the "
+                                            "strands created so far when "
+                                            "cancelled with Esc",
+                                default=True)
 
     # Draw
     def draw(self, context):
-        random.seed(self.seed)
         layout = self.layout
 
         # Options
@@ -116,17 +308,56 @@ class Spiderweb(bpy.types.Operator):
         box.label(text="Main strands")
         box.prop(self, 'amount')
         box.prop(self, 'main_iterations')
+        box.prop(self, 'pairing')
+        if self.pairing == 'NEAREST':
+            box.prop(self, 'neighbours')
+            box.prop(self, 'max_length')
         box = layout.box()
         box.label(text="Sub strands")
         box.prop(self, 'include_sub')
         box.prop(self, 'sub_iterations')
+        box.prop(self, 'max_strands')
+        box.prop(self, 'max_memory')
         box = layout.box()
         box.label(text="General options")
         box.prop(self, 'method')
+        if self.method == 'POISSON':
+            box.prop(self, 'min_distance')
+        if self.method in {'SURFACE', 'POISSON'}:
+            box.prop(self, 'density_source')
+            if self.density_source != 'NONE':
+                box.prop(self, 'density_name')
         box.prop(self, 'seed')
-        box.prop(self, 'drape_min')
-        box.prop(self, 'drape_max')
-        box.prop(self, 'length_solver')
+        box.prop(self, 'threads')
+        box.prop(self, 'drape_mode')
+        if self.drape_mode == 'CATENARY':
+            box.prop(self, 'slack_min')
+            box.prop(self, 'slack_max')
+            box.prop(self, 'point_count')
+        else:
+            box.prop(self, 'drape_min')
+            box.prop(self, 'drape_max')
+            box.prop(self, 'length_solver')
+        box.prop(self, 'adaptive_resolution')
+        row = box.row()
+        row.active = self.adaptive_resolution
+        row.prop(self, 'tolerance')
+        box.prop(self, 'collision')
+        if self.collision != 'NONE':
+            box.prop(self, 'collide_scene')
+        if self.collision == 'RESAMPLE':
+            box.prop(self, 'attempts')
+        box = layout.box()
+        box.label(text="Output")
+        box.prop(self, 'output')
+        if self.output == 'MESH':
+            box.prop(self, 'use_wire_material')
+        box.prop(self, 'shard_method')
+        if self.shard_method == 'GRID':
+            box.prop(self, 'shard_grid')
+        elif self.shard_method == 'COUNT':
+            box.prop(self, 'shard_size')
+        box.prop(self, 'keep_partial')
 
     # Poll
     @classmethod
@@ -136,139 +367,456 @@ class Spiderweb(bpy.types.Operator):
                 if obj.type == 'MESH':
                     return True
 
-    # Execute
-    def execute(self, context):
+    def get_resolutions(self, control_points):
+        if self.adaptive_resolution:
+            return curve_tools.get_adaptive_resolutions(control_points,
+                                                        self.tolerance)
+        return numpy.full(len(control_points), 12)
 
-        def drape_spline(spline):
-            drape = random.uniform(self.drape_min, self.drape_max)
-            # For now only a spline with 3 points works
-            if self.length_solver:
-                simple_length = (spline[2] - spline[0]).length / 5
-            else:
-                simple_length = 1
-            spline[1].z += drape * simple_length
+    def get_drapes(self, control_points, random_state):
+        if self.drape_mode == 'CATENARY':
+            slacks = random_state.uniform(self.slack_min,
+                                          self.slack_max,
+                                          len(control_points))
+            return strand_tools.get_catenary_offsets(control_points[:, 0],
+                                                     control_points[:, -1],
+                                                     slacks,
+                                                     self.point_count)
+
+        # Only the middle of 3 point strands is moved
+        drapes = random_state.uniform(self.drape_min,
+                                      self.drape_max,
+                                      len(control_points))
+        if self.length_solver:
+            # The strands are still straight, so their length is the
+            # distance between their ends
+            lengths = numpy.linalg.norm(
+                control_points[:, -1] - control_points[:, 0], axis=1)
+            drapes *= lengths / 5
+        offsets = numpy.zeros(control_points.shape[:2])
+        offsets[:, 1] = drapes
+
+        return offsets
 
-            return spline
+    # Create the strands
+    def iter_strands(self, chunk_size=65536):
+        # Creates the strands of the web in steps and stores them in
+        # self.buffer (None if no web can be created). Yields the progress
+        # (0 to 1) and the ids of the strands added by every step.
 
-        def drape_splines(splines):
-            draped_splines = []
-            for spline in splines:
-                spline = drape_spline(spline)
-                draped_splines.append(spline)
+        def collide(control_points, source_ids):
+            start = time.time()
+            points, counts = curve_tools.tessellate_splines(
+                control_points, self.get_resolutions(control_points))
+            if self.method == 'VOLUME':
+                # Strands start and end inside their own objects
+                ignored = numpy.where(source_ids >= 0,
+                                      collider_ids[source_ids], -1)
+            else:
+                ignored = None
+            colliding = mesh_tools.find_collisions(colliders, points, counts,
+                                                   ignored=ignored)
+            collision_stats["time"] += time.time() - start
+            collision_stats["rejected"] += int(colliding.sum())
 
-            return draped_splines
+            return colliding
 
+        self.buffer = None
         selected_objects = bpy.context.selected_objects
         web_objects = [obj for obj in selected_objects if obj.type == 'MESH']
+        web_random = random_tools.CounterRandom(self.seed)
+        if (self.method in {'SURFACE', 'POISSON'} and
+                self.density_source != 'NONE' and self.density_name):
+            density = (self.density_source, self.density_name)
+            # The weights are read once per run (in Python, per vertex)
+            density_signatures = [mesh_tools.get_density_signature(obj,
+                                                                   density)
+                                  for obj in web_objects]
+        else:
+            density = None
+            density_signatures = [None] * len(web_objects)
 
-        # Get (random) points on/in the selected objects.
-        end_points = []
-        # Determine how many points to create per object,
-        # to get <amount> total points.
-        quotient, remainder = divmod(self.amount, len(web_objects))
-        # Randomize order of selected objects
-        random.seed(self.seed)
-        random.shuffle(web_objects)
-        for i, obj in enumerate(web_objects):
-            if i in range(remainder):
-                obj_amount = quotient + 1
-            else:
-                obj_amount = quotient
-            points = mesh_tools.get_points(obj,
-                                           amount=obj_amount,
-                                           method=self.method,
-                                           apply_modifiers=True,
-                                           seed=self.seed)
-            end_points.append([obj, points])
-
-        end_vectors = list(itertools.chain(*(l[1] for l in end_points)))
+        # Every stage is only rerun when its settings (or the objects it
+        # depends on) changed since the last run, so tweaking the drape or
+        # output in the redo panel reuses the points and strands.
+        points_key = (tuple(mesh_tools.get_object_signature(obj)
+                            for obj in web_objects),
+                      tuple(density_signatures),
+                      self.amount,
+                      self.method,
+                      self.seed,
+                      density,
+                      self.min_distance)
+        cached = STAGE_CACHE.get("points")
+        if cached is not None and cached[0] == points_key:
+            end_points, object_ids, sample_names = cached[1:]
+        else:
+            STAGE_CACHE.clear()
+            # Get (random) points on/in the selected objects.
+            # Determine how many points to create per object,
+            # to get <amount> total points.
+            quotient, remainder = divmod(self.amount, len(web_objects))
+            # Randomize order of selected objects
+            order = web_random.stream(
+                random_tools.STREAM_OBJECTS).permutation(len(web_objects))
+            sample_objects = [web_objects[i] for i in order]
+            amounts = [quotient + 1 if i < remainder else quotient
+                       for i in range(len(sample_objects))]
+            points = mesh_tools.get_points_batch(
+                sample_objects,
+                amounts,
+                method=self.method,
+                apply_modifiers=True,
+                seed=self.seed,
+                density=density,
+                min_distance=self.min_distance,
+                threads=self.threads,
+                density_signatures=[density_signatures[i] for i in order])
+            if points is None:
+                return
+            end_points = numpy.concatenate(points)
+            object_ids = numpy.repeat(numpy.arange(len(points)),
+                                      [len(p) for p in points])
+            sample_names = [obj.name for obj in sample_objects]
+            STAGE_CACHE["points"] = (points_key, end_points, object_ids,
+                                     sample_names)
+            yield 0.0, range(0)
 
         # Create splines between two random points.
-        if not len(end_vectors) > 1:
+        if not len(end_points) > 1:
             # We need at least 2 points.
             return
 
-        # Create the points of the main strands (every spline has 3 points)
-        main_splines = []
-        random.seed(self.seed)
-        for i in range(self.main_iterations):
-            for ip, start_point in enumerate(end_vectors):
-                for _ in range(9999):
-                    end_point = random.choice(end_vectors)
-                    if not end_point == start_point:
-                        break
-                mid_point = start_point + (end_point - start_point) * 0.5
-                main_splines.append((start_point, mid_point, end_point))
-
-        # Drape main splines
-        random.seed(self.seed)
-        main_splines = drape_splines(main_splines)
-
-        def sub_strands_iter(splines, count=0):
-            if count >= self.sub_iterations:
-                return splines
-            splines += create_sub_strands(splines)
-            count += 1
-            return sub_strands_iter(splines, count)
-
-        def create_sub_strands(splines, points=None):
-            new_splines = []
-            if not points:
-                resolution_points = [curve_tools.get_nurbs_points(spline)
-                                     for spline in splines]
+        # Test the strands against the selected (or all visible) meshes
+        collision_stats = {"time": 0.0, "rejected": 0}
+        if self.collision == 'NONE':
+            collision = None
+            attempts = 0
+            colliders_key = None
+        else:
+            start = time.time()
+            if self.collide_scene:
+                scene = bpy.context.scene
+                collider_objects = [obj for obj in scene.objects
+                                    if obj.type == 'MESH' and
+                                    obj.is_visible(scene)]
             else:
-                resolution_points = points
-            for _ in range(0, len(resolution_points), 2):
-                # Pick a random spline to start from
-                spline1 = random.choice(resolution_points)
-                # Pick a random spline to end which is not the start spline
-                for _ in range(9999):
-                    spline2 = random.choice(resolution_points)
-                    if not spline2 == spline1:
-                        break
-                # Pick a random start point from spline1
-                start_index = int(random.triangular(0, len(spline1)))
-                start_point = spline1[start_index]
-                # Pick a ranomd end point from spline2
-                end_index = int(random.triangular(0, len(spline2)))
-                end_point = spline2[end_index]
-                # Create the mid point
-                mid_point = start_point + (end_point - start_point) * 0.5
-                new_spline = (start_point, mid_point, end_point)
-                # Drape the spline
-                new_spline = drape_spline(new_spline)
-                new_splines.append(new_spline)
-                splines.append(new_spline)
-
-            return new_splines
-
-        random.seed(self.seed)
-        if self.sub_iterations and self.include_sub:
-            splines = sub_strands_iter(main_splines)
-        elif self.sub_iterations and not self.include_sub:
-            sub_splines = []
-            points = [curve_tools.get_nurbs_points(spline)
-                      for spline in main_splines]
-            for _ in range(self.sub_iterations):
-                sub_splines += create_sub_strands(main_splines, points)
-            splines = main_splines + sub_splines
+                collider_objects = web_objects
+            colliders = mesh_tools.get_colliders(collider_objects)
+            # The collider of every sampled object (-1 for none)
+            indices = {collider["name"]: index
+                       for index, collider in enumerate(colliders)}
+            collider_ids = numpy.array([indices.get(name, -1)
+                                        for name in sample_names],
+                                       dtype=numpy.int64)
+            colliders_key = tuple(mesh_tools.get_object_signature(obj)
+                                  for obj in collider_objects)
+            collision_stats["time"] += time.time() - start
+            collision = collide
+            if self.collision == 'RESAMPLE':
+                attempts = self.attempts
+            else:
+                attempts = 0
+            yield 0.0, range(0)
+
+        # The drape only changes the control points, unless colliding
+        # strands are rejected (which depends on how they hang).
+        if self.drape_mode == 'CATENARY':
+            point_count = self.point_count
+        else:
+            point_count = 3
+        if self.pairing == 'NEAREST':
+            neighbours = self.neighbours
         else:
-            splines = main_splines
+            neighbours = 0
+        drape_key = (self.drape_mode,
+                     self.drape_min,
+                     self.drape_max,
+                     self.length_solver,
+                     self.slack_min,
+                     self.slack_max,
+                     self.adaptive_resolution,
+                     self.tolerance)
+        strands_key = (points_key,
+                       self.main_iterations,
+                       neighbours,
+                       self.max_length,
+                       self.include_sub,
+                       self.sub_iterations,
+                       self.max_strands,
+                       self.max_memory,
+                       point_count,
+                       self.collision,
+                       attempts,
+                       colliders_key)
+        if collision is not None:
+            strands_key += (drape_key,)
+        max_bytes = self.max_memory * 1024 * 1024
+        main_count = len(end_points) * self.main_iterations
+        requested = strand_tools.get_requested_count(main_count,
+                                                     self.sub_iterations,
+                                                     self.include_sub)
 
-        curve = curve_tools.create_curve(name="web")
-        # for spline in main_splines + sub_splines:
-        for spline in splines:
-            points = [p for p in spline]
-            curve_tools.create_spline(curve=curve, points=points)
+        cached = STAGE_CACHE.get("strands")
+        if cached is not None and cached[0] == strands_key:
+            buffer = cached[2]
+            if cached[1] != drape_key:
+                # Hang the cached strands again with the new drape
+                strand_tools.drape_strands(buffer, end_points, web_random,
+                                           drape=self.get_drapes)
+            message = "Reused {} of {:.0f} requested strands".format(
+                len(buffer), requested)
+        else:
+            # Drop the old strands before creating new ones
+            STAGE_CACHE.pop("strands", None)
+            # Make room for all strands up front, within the budget
+            buffer = strand_tools.StrandBuffer(point_count)
+            total = int(min(requested,
+                            self.max_strands,
+                            max_bytes // buffer.strand_size))
+            buffer.reserve(total)
+            self.buffer = buffer
+
+            # Create the draped main strands
+            for ids in strand_tools.iter_main_strands(
+                    buffer,
+                    end_points,
+                    self.main_iterations,
+                    web_random,
+                    object_ids=object_ids,
+                    drape=self.get_drapes,
+                    max_strands=total,
+                    neighbours=neighbours,
+                    max_length=self.max_length,
+                    collide=collision,
+                    attempts=attempts,
+                    chunk_size=chunk_size):
+                yield len(buffer) / total, ids
+
+            # Every iteration adds strands between random points of the
+            # strands created so far (or of the main strands only), until
+            # the iterations are done or the budget is used up.
+            for ids in strand_tools.iter_sub_strands(
+                    buffer,
+                    self.sub_iterations,
+                    web_random,
+                    self.include_sub,
+                    max_strands=self.max_strands,
+                    max_bytes=max_bytes,
+                    chunk_size=chunk_size,
+                    drape=self.get_drapes,
+                    collide=collision,
+                    attempts=attempts):
+                yield len(buffer) / total, ids
+            message = "Created {} of {:.0f} requested strands".format(
+                len(buffer), requested)
+            if collision is not None:
+                message += (", rejected {} colliding strands (collision "
+                            "test took {:.2f} s)").format(
+                                collision_stats["rejected"],
+                                collision_stats["time"])
+        STAGE_CACHE["strands"] = (strands_key, drape_key, buffer)
+        self.buffer = buffer
+        self.report({'INFO'}, message)
 
-        web = bpy.data.objects.new("web", curve)
+    # Build the web
+    def create_web(self, name, control_points, resolutions):
+        if self.output == 'MESH':
+            points, counts = curve_tools.tessellate_splines(control_points,
+                                                            resolutions)
+            data = curve_tools.create_wire_mesh(name=name,
+                                                points=points,
+                                                counts=counts)
+        else:
+            data = curve_tools.create_curve(name=name)
+            options = dict(curve_tools.SPLINE_OPTIONS,
+                           resolution_u=resolutions)
+            curve_tools.create_splines(curve=data,
+                                       points=control_points,
+                                       options=options)
+
+        web = bpy.data.objects.new(name, data)
         bpy.context.scene.objects.link(web)
-        bpy.context.scene.objects.active = web
+        if self.output == 'MESH' and self.use_wire_material:
+            curve_tools.add_wire_material(web)
+        self.created.append(web)
+
+        return web
+
+    def adds_strands(self):
+        # A single curve can get the strands while they are created
+        return self.output == 'CURVE' and self.shard_method == 'NONE'
+
+    def add_strands(self, ids):
+        if not len(ids):
+            return
+        control_points = self.buffer.control_points[ids.start:ids.stop]
+        resolutions = self.get_resolutions(control_points)
+        if self.web is None:
+            self.web = self.create_web("web", control_points, resolutions)
+        else:
+            options = dict(curve_tools.SPLINE_OPTIONS,
+                           resolution_u=resolutions)
+            curve_tools.create_splines(curve=self.web.data,
+                                       points=control_points,
+                                       options=options)
+
+    def iter_webs(self):
+        # Creates the objects of the web from the buffer (unless the strands
+        # were added while they were created) and yields the progress (0 to
+        # 1) after every object.
+        if self.web is None:
+            control_points = self.buffer.control_points
+            resolutions = self.get_resolutions(control_points)
+            if self.shard_method == 'NONE':
+                self.web = self.create_web("web", control_points,
+                                           resolutions)
+            else:
+                # Parent all shards to an empty
+                self.web = bpy.data.objects.new("web", None)
+                bpy.context.scene.objects.link(self.web)
+                self.created.append(self.web)
+                shards = curve_tools.partition_splines(
+                    control_points,
+                    self.shard_method,
+                    grid_size=self.shard_grid,
+                    max_count=self.shard_size)
+                for i, indices in enumerate(shards):
+                    shard = self.create_web("web_shard{:03d}".format(i),
+                                            control_points[indices],
+                                            resolutions[indices])
+                    shard.parent = self.web
+                    yield (i + 1) / len(shards)
+        bpy.context.scene.objects.active = self.web
+
+    def remove_objects(self, objects):
+        scene = bpy.context.scene
+        for obj in objects:
+            # The object can't be used anymore once it is removed
+            data, data_type = obj.data, obj.type
+            scene.objects.unlink(obj)
+            bpy.data.objects.remove(obj)
+            if data_type == 'MESH':
+                bpy.data.meshes.remove(data)
+            elif data_type == 'CURVE':
+                bpy.data.curves.remove(data)
+
+    # Execute
+    def execute(self, context):
+        self.web = None
+        self.created = []
+        for _ in self.iter_strands():
+            pass
+        if self.buffer is None:
+            return {'CANCELLED'}
+        for _ in self.iter_webs():
+            pass
 
         return {'FINISHED'}
 
+    # Show the strands created so far as light wire meshes
+    def add_preview(self, ids):
+        if not len(ids):
+            return
+        control_points = self.buffer.control_points[ids.start:ids.stop]
+        points, counts = curve_tools.tessellate_splines(
+            control_points, self.get_resolutions(control_points))
+        mesh = curve_tools.create_wire_mesh(name="web_preview",
+                                            points=points,
+                                            counts=counts)
+        preview = bpy.data.objects.new("web_preview", mesh)
+        bpy.context.scene.objects.link(preview)
+        self.previews.append(preview)
+
+    def iter_steps(self):
+        # Creates the strands, adding them to the web or showing them as
+        # previews, then builds the web. Yields the progress (0 to 1).
+        if self.adds_strands():
+            build_share = 0.0
+        else:
+            build_share = self.modal_build_share
+        for progress, ids in self.iter_strands(
+                chunk_size=self.modal_chunk_size):
+            if self.adds_strands():
+                self.add_strands(ids)
+            else:
+                self.add_preview(ids)
+            yield progress * (1.0 - build_share)
+        if self.buffer is None:
+            return
+        for progress in self.iter_build():
+            yield 1.0 - build_share + progress * build_share
+
+    def iter_build(self):
+        self.building = True
+        self.remove_objects(self.previews)
+        self.previews = []
+        for progress in self.iter_webs():
+            yield progress
+
     # Invoke
     def invoke(self, context, event):
-        self.execute(context)
+        # Create the web in steps from a timer, so the viewport is updated
+        # and the operator can be cancelled in between.
+        self.buffer = None
+        self.web = None
+        self.created = []
+        self.previews = []
+        self.building = False
+        self.steps = self.iter_steps()
+        wm = context.window_manager
+        wm.progress_begin(0, 100)
+        self.timer = wm.event_timer_add(0.01, context.window)
+        wm.modal_handler_add(self)
 
-        return {'FINISHED'}
+        return {'RUNNING_MODAL'}
+
+    # Modal
+    def modal(self, context, event):
+        # Always remove the timer and progress bar, even if a step fails
+        try:
+            return self.step(context, event)
+        except Exception:
+            self.finish(context, {'CANCELLED'})
+            raise
+
+    def step(self, context, event):
+        if event.type == 'ESC' and event.value == 'PRESS':
+            self.steps.close()
+            if (self.keep_partial and self.buffer is not None and
+                    not self.building):
+                # Build the web from the strands created so far
+                self.report({'INFO'}, "Cancelled, kept {} strands".format(
+                    len(self.buffer)))
+                self.steps = self.iter_build()
+                return {'RUNNING_MODAL'}
+            self.remove_objects(self.previews + self.created)
+            self.report({'INFO'}, "Cancelled")
+            return self.finish(context, {'CANCELLED'})
+        if event.type != 'TIMER':
+            return {'PASS_THROUGH'}
+
+        # Take at least one step, then give Blender time to redraw
+        start = time.time()
+        while True:
+            try:
+                progress = next(self.steps)
+            except StopIteration:
+                if self.buffer is None:
+                    return self.finish(context, {'CANCELLED'})
+                return self.finish(context, {'FINISHED'})
+            context.window_manager.progress_update(progress * 100)
+            if time.time() - start > self.modal_step_time:
+                break
+        for area in context.screen.areas:
+            if area.type == 'VIEW_3D':
+                area.tag_redraw()
+
+        return {'RUNNING_MODAL'}
+
+    def finish(self, context, result):
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        wm.progress_end()
+
+        return result
@@ -19,9 +19,12 @@
 
 import time
 import math
+import functools
+import collections
 import bpy
 import mathutils
 import bmesh
+import numpy
 
 
 def create_curve(name='curve',
@@ -51,17 +54,25 @@ def create_curve(name='curve',
     return curve
 
 
+# The settings of the splines of a web.
+SPLINE_OPTIONS = {"use_cyclic_u": False,
+                  "use_bezier_u": False,
+                  "use_endpoint_u": True,
+                  "order_u": 3,
+                  "resolution_u": 12,
+                  "tilt_interpolation": 'LINEAR',
+                  "radius_interpolation": 'LINEAR',
+                  "use_smooth": True}
+
+# The spline options which change the knots. These have to be set per spline,
+# because foreach_set skips the update that recalculates the knots.
+KNOT_OPTIONS = ("use_cyclic_u", "use_bezier_u", "use_endpoint_u", "order_u")
+
+
 def create_spline(curve=None,
                   points=None,
                   spline_type='NURBS',
-                  options={"use_cyclic_u": False,
-                           "use_bezier_u": False,
-                           "use_endpoint_u": True,
-                           "order_u": 3,
-                           "resolution_u": 12,
-                           "tilt_interpolation": 'LINEAR',
-                           "radius_interpolation": 'LINEAR',
-                           "use_smooth": True}):
+                  options=SPLINE_OPTIONS):
     """
     create_spline(curve curve, list of vector points,
                   string curve_type, dict options) -> tuple (curve, spline)
@@ -109,12 +120,554 @@ def create_spline(curve=None,
     return (curve, spline)
 
 
+def create_splines(curve=None,
+                   points=None,
+                   counts=None,
+                   options=SPLINE_OPTIONS,
+                   radius=None,
+                   tilt=None,
+                   spline_type='NURBS'):
+    """
+    create_splines(curve curve, array points, array counts, dict options,
+                   array radius, array tilt, string spline_type)
+            -> curve curve
+
+        Adds many splines to the given curve at once. The coordinates (and
+        optionally radius and tilt) are written with one foreach_set per
+        spline and the numeric/boolean options with one foreach_set for all
+        new splines, instead of an RNA call per point and per setting. Only
+        the options which change the knots (see KNOT_OPTIONS) are set per
+        spline, so Blender recalculates the knots.
+        Returns the curve, or nothing if no splines were created.
+        !!! For now only 'NURBS' and 'POLY' are supported.
+
+        curve curve        - The curve to create the splines on
+        array points       - (N, P, 3|4) array with the points per spline, or
+                             (M, 3|4) array with the points of all splines
+                             after each other (then counts is needed)
+        array counts       - (N,) array with the number of points per spline
+        dict options       - The settings for the splines, a value can also
+                             be an (N,) array with a value per spline
+        array radius       - (M,) array with the radius per point
+        array tilt         - (M,) array with the tilt per point
+        string spline_type - The type of splines to create
+    """
+
+    if not curve:
+        print("No curve given to create the splines on")
+        return
+    valid_spline_types = {'POLY', 'NURBS'}
+    if not spline_type in valid_spline_types:
+        print("Spline type: {} is not valid/supported".format(spline_type))
+        return
+    if curve.splines:
+        if not curve.splines[0].type == spline_type:
+            print("{} not compatible with other splines "
+                  "on curve".format(spline_type))
+            return
+
+    points = numpy.asarray(points, dtype=numpy.float32)
+    if counts is None:
+        counts = numpy.full(len(points), points.shape[1], dtype=numpy.int64)
+        points = points.reshape(-1, points.shape[-1])
+    counts = numpy.asarray(counts, dtype=numpy.int64)
+    if not len(counts) or counts.min() < 2:
+        print("No points to create the splines from")
+        return
+    if points.shape[1] == 3:
+        points = numpy.concatenate(
+            (points, numpy.ones((len(points), 1), dtype=numpy.float32)),
+            axis=1)
+    co = points.ravel()
+    if radius is not None:
+        radius = numpy.asarray(radius, dtype=numpy.float32)
+    if tilt is not None:
+        tilt = numpy.asarray(tilt, dtype=numpy.float32)
+
+    # The options which change the knots, the order last (it is clamped to
+    # the number of points and the knots depend on the flags)
+    knot_options = [(k, options[k]) for k in KNOT_OPTIONS if k in options]
+    knot_options = [(k, value.tolist() if isinstance(value, numpy.ndarray)
+                     else [value] * len(counts))
+                    for k, value in knot_options]
+
+    # Allocate the splines and write their points. The knot options can only
+    # be set after the points exist.
+    first_spline = len(curve.splines)
+    offsets = numpy.concatenate(((0,), numpy.cumsum(counts)))
+    splines = curve.splines
+    for i, (start, end) in enumerate(zip(offsets[:-1].tolist(),
+                                         offsets[1:].tolist())):
+        spline = splines.new(spline_type)
+        spline_points = spline.points
+        spline_points.add(count=end - start - 1)
+        spline_points.foreach_set('co', co[start * 4:end * 4])
+        if radius is not None:
+            spline_points.foreach_set('radius', radius[start:end])
+        if tilt is not None:
+            spline_points.foreach_set('tilt', tilt[start:end])
+        for k, values in knot_options:
+            try:
+                setattr(spline, k, values[i])
+            except (AttributeError, TypeError) as err:
+                print("{}\nSkipping this setting...".format(err))
+
+    # Set the other options, numbers and booleans for all splines at once.
+    new_splines = curve.splines[first_spline:]
+    for k in options.keys():
+        if k in KNOT_OPTIONS:
+            continue
+        value = options[k]
+        if isinstance(value, str):
+            # Enums can't be set with foreach_set. New splines all start
+            # with the same defaults, so mostly nothing has to be done.
+            if getattr(new_splines[0], k, value) == value:
+                continue
+            try:
+                for spline in new_splines:
+                    setattr(spline, k, value)
+            except (AttributeError, TypeError) as err:
+                print("{}\nSkipping this setting...".format(err))
+            continue
+        if numpy.asarray(value).dtype.kind == 'f':
+            dtype = numpy.float32
+        else:
+            dtype = numpy.int32
+        # Read the values of the existing splines, so they are kept.
+        values = numpy.zeros(len(curve.splines), dtype=dtype)
+        try:
+            if first_spline:
+                curve.splines.foreach_get(k, values)
+            values[first_spline:] = value
+            curve.splines.foreach_set(k, values)
+        except (AttributeError, TypeError) as err:
+            print("{}\nSkipping this setting...".format(err))
+
+    return curve
+
+
+# Arc length tables of the splines of existing curves, by the settings and
+# control points of the spline (so a table can't be used for another spline,
+# even if Blender reuses the memory of a curve). The least recently used
+# tables are dropped when there are more than ARC_LENGTH_CACHE_SIZE.
+ARC_LENGTH_CACHE = collections.OrderedDict()
+ARC_LENGTH_CACHE_SIZE = 65536
+
+
+def get_arc_length_tables(points):
+    """
+    get_arc_length_tables(numpy array points) -> numpy array tables
+
+        Calculates the cumulative arc length at every point of N tessellated
+        splines. The first column is always 0.0, the last one is the length
+        of the spline.
+
+        numpy array points - (N, R, 3) array with the tessellated points
+    """
+
+    points = numpy.asarray(points, dtype=numpy.float64)
+    segment_lengths = numpy.linalg.norm(numpy.diff(points, axis=1), axis=2)
+    tables = numpy.zeros(points.shape[:2])
+    numpy.cumsum(segment_lengths, axis=1, out=tables[:, 1:])
+
+    return tables
+
+
+def get_lengths_batch(control_points, resolution_u=12, **settings):
+    """
+    get_lengths_batch(array control_points, int resolution_u, **settings)
+            -> numpy array lengths
+
+        Returns the length of N NURBS splines which share the same settings.
+        The settings are passed on to get_nurbs_points_batch.
+
+        array control_points - (N, P, 4) or (N, P, 3) array of control points
+        int resolution_u     - the resolution to measure the splines at, or
+                               an (N,) array with a resolution per spline
+                               (see get_adaptive_resolutions)
+    """
+
+    control_points = numpy.asarray(control_points, dtype=numpy.float64)
+    resolutions = numpy.empty(len(control_points), dtype=numpy.int64)
+    resolutions[:] = resolution_u
+    lengths = numpy.zeros(len(control_points))
+    for resolution in numpy.unique(resolutions):
+        mask = resolutions == resolution
+        points = get_nurbs_points_batch(control_points[mask],
+                                        resolution_u=int(resolution),
+                                        **settings)
+        lengths[mask] = get_arc_length_tables(points)[:, -1]
+
+    return lengths
+
+
+def get_adaptive_resolutions(control_points,
+                             tolerance=0.001,
+                             order_u=3,
+                             min_resolution=1,
+                             max_resolution=64):
+    """
+    get_adaptive_resolutions(array control_points, float tolerance,
+                             int order_u, int min_resolution,
+                             int max_resolution) -> numpy array resolutions
+
+        Picks a resolution per spline, so the tessellated spline deviates
+        less than tolerance from the real one. The second differences of
+        the control points bound the second derivative of the spline, which
+        bounds the error of the chords: p(p - 1) * D / (8 * resolution^2)
+        for degree p. Straight splines get min_resolution, long and heavily
+        draped splines get more points.
+
+        array control_points - (N, P, 4) or (N, P, 3) array of control points
+        float tolerance      - the maximum distance between the tessellated
+                               and the real spline (in object space)
+        int order_u          - the order of the splines
+        int min_resolution   - the lowest resolution to return
+        int max_resolution   - the highest resolution to return
+    """
+
+    control_points = numpy.asarray(control_points, dtype=numpy.float64)
+    coords = control_points[..., :3]
+    if coords.shape[1] < 3:
+        return numpy.full(len(coords), min_resolution, dtype=numpy.int64)
+
+    second_differences = coords[:, :-2] - 2.0 * coords[:, 1:-1] + coords[:, 2:]
+    bound = numpy.linalg.norm(second_differences, axis=2).max(axis=1)
+    degree = min(order_u, coords.shape[1]) - 1
+    resolutions = numpy.ceil(numpy.sqrt(
+        degree * (degree - 1) * bound / (8.0 * max(tolerance, 1e-12))))
+
+    return numpy.clip(resolutions,
+                      min_resolution,
+                      max_resolution).astype(numpy.int64)
+
+
+def get_arc_length_tables_of_curve(curve, splines=None):
+    """
+    get_arc_length_tables_of_curve(curve curve, list of int splines)
+            -> list of numpy array tables
+
+        Returns the cumulative arc length table of every NURBS spline of the
+        curve (None for other splines). The tables are cached per spline and
+        only the splines whose points or settings changed since the last
+        call are tessellated again, in batches per configuration.
+
+        curve curve            - the curve (data) to process
+        list of int splines    - only process the splines with these indices
+    """
+
+    if splines is None:
+        splines = range(len(curve.splines))
+
+    tables = {}
+    groups = {}
+    for i in splines:
+        spline = curve.splines[i]
+        if spline.type != 'NURBS' or not len(spline.points) > 1:
+            tables[i] = None
+            continue
+        settings = get_spline_settings(curve, spline)
+        control_points = get_spline_control_points(spline)
+        signature = (settings, control_points.tobytes())
+        table = ARC_LENGTH_CACHE.get(signature)
+        if table is not None:
+            ARC_LENGTH_CACHE.move_to_end(signature)
+            tables[i] = table
+            continue
+        groups.setdefault(settings, []).append((i, signature,
+                                                control_points))
+
+    for settings, group in groups.items():
+        control_points = numpy.array([cp for _, _, cp in group])
+        points = evaluate_nurbs_basis(get_nurbs_basis(*settings),
+                                      control_points)
+        for (i, signature, _), table in zip(group,
+                                            get_arc_length_tables(points)):
+            ARC_LENGTH_CACHE[signature] = table
+            tables[i] = table
+    while len(ARC_LENGTH_CACHE) > ARC_LENGTH_CACHE_SIZE:
+        ARC_LENGTH_CACHE.popitem(last=False)
+
+    return [tables[i] for i in splines]
+
+
+def get_lengths(curve):
+    """
+    get_lengths(curve curve) -> numpy array lengths
+
+        Returns the length of every spline of the curve (0.0 for splines
+        which are not NURBS).
+    """
+
+    tables = get_arc_length_tables_of_curve(curve)
+
+    return numpy.array([t[-1] if t is not None else 0.0 for t in tables])
+
+
 def get_length(curve, spline):
-    pass
+    """
+    get_length(curve curve, int spline) -> float length
+
+        Returns the length of the spline with the given index on the curve.
+    """
+
+    table = get_arc_length_tables_of_curve(curve, [spline])[0]
+    if table is None:
+        return 0.0
+
+    return float(table[-1])
+
+
+def clear_arc_length_cache(curve=None):
+    """
+    clear_arc_length_cache(curve curve)
+
+        Forgets the cached arc length tables of the splines of the given
+        curve, or of all curves if no curve is given.
+    """
+
+    if curve is None:
+        ARC_LENGTH_CACHE.clear()
+        return
+    for spline in curve.splines:
+        if spline.type == 'NURBS':
+            signature = (get_spline_settings(curve, spline),
+                         get_spline_control_points(spline).tobytes())
+            ARC_LENGTH_CACHE.pop(signature, None)
+
+
+def get_spline_parameters(point_count_u, resolution_u=12,
+                          use_cyclic_u=False):
+    """
+    get_spline_parameters(int point_count_u, int resolution_u,
+                          bool use_cyclic_u) -> numpy array parameters
+
+        Returns the normalized (0.0 - 1.0) parameters of the points
+        get_nurbs_basis tessellates a spline with these settings at.
+        For cyclic splines the closing parameter 1.0 is included as well.
+    """
 
+    segments_u = macro_segmentsu(use_cyclic_u, point_count_u)
+    resolu = max(resolution_u * segments_u, 1)
+    if use_cyclic_u:
+        return numpy.linspace(0.0, 1.0, resolu + 1)
 
-def get_point_on_curve(curve, spline, position):
-    pass
+    return numpy.linspace(0.0, 1.0, max(resolu, 2))[:resolu]
+
+
+def arc_length_to_parameters(control_points, positions,
+                             order_u=3,
+                             resolution_u=12,
+                             use_cyclic_u=False,
+                             use_endpoint_u=True,
+                             use_bezier_u=False):
+    """
+    arc_length_to_parameters(array control_points, array positions,
+                             int order_u, int resolution_u,
+                             bool use_cyclic_u, bool use_endpoint_u,
+                             bool use_bezier_u) -> numpy array parameters
+
+        Converts positions along the length of N splines (0.0 is the start,
+        1.0 is the end) to spline parameters, by interpolating in the arc
+        length tables of the tessellated splines.
+
+        array control_points - (N, P, 4) array with the control points
+        array positions      - (N,) array with the relative arc lengths
+    """
+
+    control_points = numpy.asarray(control_points, dtype=numpy.float64)
+    positions = numpy.clip(numpy.asarray(positions, dtype=numpy.float64),
+                           0.0, 1.0)
+    points = get_nurbs_points_batch(control_points,
+                                    order_u=order_u,
+                                    resolution_u=resolution_u,
+                                    use_cyclic_u=use_cyclic_u,
+                                    use_endpoint_u=use_endpoint_u,
+                                    use_bezier_u=use_bezier_u)
+    if use_cyclic_u:
+        points = numpy.concatenate((points, points[:, :1]), axis=1)
+    grid = get_spline_parameters(control_points.shape[1], resolution_u,
+                                 use_cyclic_u)
+    tables = get_arc_length_tables(points)
+    lengths = tables[:, -1:]
+    # Normalize the tables (zero length splines get an even spread) and
+    # offset every row, so one searchsorted can do all rows at once.
+    tables = numpy.where(lengths > 0.0,
+                         tables / numpy.where(lengths > 0.0, lengths, 1.0),
+                         grid)
+    rows = numpy.arange(len(tables))
+    offsets = rows * 2.0
+    flat = (tables + offsets[:, numpy.newaxis]).ravel()
+    count = tables.shape[1]
+    index = numpy.searchsorted(flat, positions + offsets, side='right') - 1
+    index = numpy.clip(index - rows * count, 0, count - 2)
+    low = tables[rows, index]
+    high = tables[rows, index + 1]
+    span = high - low
+    fac = numpy.where(span > 0.0,
+                      (positions - low) / numpy.where(span > 0.0, span, 1.0),
+                      0.0)
+
+    return grid[index] + fac * (grid[index + 1] - grid[index])
+
+
+def get_points_on_splines(control_points, parameters,
+                          order_u=3,
+                          use_cyclic_u=False,
+                          use_endpoint_u=True,
+                          use_bezier_u=False,
+                          use_arc_length=False,
+                          resolution_u=12):
+    """
+    get_points_on_splines(array control_points, array parameters,
+                          int order_u, bool use_cyclic_u,
+                          bool use_endpoint_u, bool use_bezier_u,
+                          bool use_arc_length, int resolution_u)
+            -> numpy array points
+
+        Evaluates N splines (which share the same settings) exactly, each
+        at its own parameter. 0.0 is the start and 1.0 is the end of the
+        spline. The common 3 point quadratic spline with end points is a
+        quadratic bezier curve and is solved in closed form, the others are
+        evaluated with de Boor's algorithm.
+
+        array control_points - (N, P, 4) array with the control points,
+                               (N, P, 3) is also accepted (all weights 1.0)
+        array parameters     - (N,) array with the parameter per spline
+        bool use_arc_length  - interpret the parameters as the relative
+                               length along the spline instead
+        int resolution_u     - the resolution of the tessellation used for
+                               the arc length parametrization
+    """
+
+    control_points = numpy.asarray(control_points, dtype=numpy.float64)
+    if control_points.shape[2] == 3:
+        weights = numpy.ones(control_points.shape[:2] + (1,))
+        control_points = numpy.concatenate((control_points, weights), axis=2)
+    point_count_u = control_points.shape[1]
+    order_u = min(order_u, point_count_u)
+    if use_arc_length:
+        parameters = arc_length_to_parameters(control_points, parameters,
+                                              order_u=order_u,
+                                              resolution_u=resolution_u,
+                                              use_cyclic_u=use_cyclic_u,
+                                              use_endpoint_u=use_endpoint_u,
+                                              use_bezier_u=use_bezier_u)
+    t = numpy.clip(numpy.asarray(parameters, dtype=numpy.float64), 0.0, 1.0)
+    t = t[:, numpy.newaxis]
+
+    quadratic_bezier = (point_count_u == 3 and
+                        order_u == 3 and
+                        use_endpoint_u and
+                        not use_bezier_u and
+                        not use_cyclic_u)
+    if quadratic_bezier and numpy.all(control_points[..., 3] == 1.0):
+        p0, p1, p2 = (control_points[:, i, :3] for i in range(3))
+        return ((1.0 - t) ** 2 * p0 +
+                2.0 * t * (1.0 - t) * p1 +
+                t ** 2 * p2)
+
+    # de Boor on the homogeneous control points.
+    degree = order_u - 1
+    knots = numpy.array(get_nurbs_knots(order_u, point_count_u,
+                                        use_cyclic_u, use_endpoint_u,
+                                        use_bezier_u))
+    if use_cyclic_u:
+        ctrl_count = point_count_u + order_u - 1
+    else:
+        ctrl_count = point_count_u
+    ustart = knots[degree]
+    uend = knots[ctrl_count]
+    u = ustart + t[:, 0] * (uend - ustart)
+    span = numpy.searchsorted(knots[:ctrl_count + 1], u, side='right') - 1
+    span = numpy.clip(span, degree, ctrl_count - 1)
+
+    homogeneous = control_points.copy()
+    homogeneous[..., :3] *= homogeneous[..., 3:]
+    rows = numpy.arange(len(control_points))[:, numpy.newaxis]
+    indices = (span[:, numpy.newaxis] - degree +
+               numpy.arange(degree + 1)) % point_count_u
+    d = homogeneous[rows, indices]
+    for r in range(1, degree + 1):
+        for j in range(degree, r - 1, -1):
+            left = knots[j + span - degree]
+            right = knots[j + 1 + span - r]
+            denominator = right - left
+            alpha = numpy.where(
+                denominator != 0.0,
+                (u - left) / numpy.where(denominator != 0.0,
+                                         denominator, 1.0),
+                0.0)[:, numpy.newaxis]
+            d[:, j] = (1.0 - alpha) * d[:, j - 1] + alpha * d[:, j]
+
+    points = d[:, degree]
+    weights = points[:, 3:]
+
+    return points[:, :3] / numpy.where(weights != 0.0, weights, 1.0)
+
+
+def get_points_on_curve(curve, splines, positions, use_arc_length=False):
+    """
+    get_points_on_curve(curve curve, array splines, array positions,
+                        bool use_arc_length) -> numpy array points
+
+        Evaluates the NURBS splines of a curve at many (spline index,
+        position) pairs at once. The pairs are grouped by the settings of
+        their splines, every group is evaluated in one go.
+
+        curve curve          - the curve (data) to evaluate
+        array splines        - (M,) array with the spline indices
+        array positions      - (M,) array with the position on the spline
+                               (0.0 is the start, 1.0 is the end)
+        bool use_arc_length  - position is the relative length instead of
+                               the spline parameter
+    """
+
+    splines = numpy.asarray(splines, dtype=numpy.int64)
+    positions = numpy.asarray(positions, dtype=numpy.float64)
+    points = numpy.zeros((len(splines), 3))
+
+    control_points = {}
+    groups = {}
+    group_ids = numpy.full(len(curve.splines), -1, dtype=numpy.int64)
+    for i in numpy.unique(splines):
+        spline = curve.splines[int(i)]
+        if spline.type != 'NURBS' or not len(spline.points) > 1:
+            continue
+        control_points[i] = get_spline_control_points(spline)
+        settings = get_spline_settings(curve, spline)
+        group_ids[i] = groups.setdefault(settings, len(groups))
+
+    for settings, group_id in groups.items():
+        order, point_count, resolution, cyclic, endpoint, bezier = settings
+        mask = group_ids[splines] == group_id
+        group_points = numpy.array([control_points[i]
+                                    for i in splines[mask]])
+        points[mask] = get_points_on_splines(group_points,
+                                             positions[mask],
+                                             order_u=order,
+                                             use_cyclic_u=cyclic,
+                                             use_endpoint_u=endpoint,
+                                             use_bezier_u=bezier,
+                                             use_arc_length=use_arc_length,
+                                             resolution_u=resolution)
+
+    return points
+
+
+def get_point_on_curve(curve, spline, position, use_arc_length=False):
+    """
+    get_point_on_curve(curve curve, int spline, float position,
+                       bool use_arc_length) -> vector point
+
+        Returns the point at position (0.0 - 1.0) on the spline with the
+        given index on the curve.
+    """
+
+    points = get_points_on_curve(curve, [spline], [position],
+                                 use_arc_length=use_arc_length)
+
+    return mathutils.Vector(points[0])
 
 
 def get_spline_as_mesh(curve, spline, link_in_scene=False):
@@ -245,256 +798,585 @@ def create_test_meshes(all_verts):
         scene.objects.link(obj)
 
 
+def partition_splines(control_points,
+                      method='GRID',
+                      grid_size=2,
+                      max_count=10000):
+    """
+    partition_splines(array control_points, string method, int grid_size,
+                      int max_count) -> list of numpy array indices
+
+        Splits N splines into spatially coherent groups (shards), based on
+        the center of their control points. Empty groups are left out.
+
+        array control_points - (N, P, 3|4) array with the control points
+        string method        - how to split the splines
+                               valid options: - 'GRID' (a grid_size^3 grid
+                                                over the bounding box)
+                                              - 'COUNT' (at most max_count
+                                                splines per group)
+        int grid_size        - the number of grid cells per axis
+        int max_count        - the maximum number of splines per group
+    """
+
+    valid_methods = {'GRID', 'COUNT'}
+    if not method in valid_methods:
+        return
+
+    centers = numpy.asarray(control_points)[..., :3].mean(axis=1)
+    if not len(centers):
+        return []
+    if method == 'COUNT':
+        # Sort along a fine grid, so consecutive splines are close together
+        grid_size = max(int(math.ceil((len(centers) / max_count) **
+                                      (1.0 / 3.0))), 1)
+    low = centers.min(axis=0)
+    extent = centers.max(axis=0) - low
+    extent[extent == 0.0] = 1.0
+    cells = numpy.floor((centers - low) / extent * grid_size)
+    cells = numpy.clip(cells, 0, grid_size - 1).astype(numpy.int64)
+    keys = (cells[:, 0] * grid_size + cells[:, 1]) * grid_size + cells[:, 2]
+    order = numpy.argsort(keys, kind='mergesort')
+
+    if method == 'COUNT':
+        return [order[i:i + max_count]
+                for i in range(0, len(order), max_count)]
+
+    _, starts = numpy.unique(keys[order], return_index=True)
+    return numpy.split(order, starts[1:])
+
+
+def create_wire_mesh(name='wire', points=None, counts=None):
+    """
+    create_wire_mesh(string name, array points, array counts) -> mesh mesh
+
+        Creates a mesh with only vertices and edges from a lot of poly
+        lines at once (the vertices and edges are written in bulk), which is
+        a lot lighter than a curve with the same amount of splines.
+
+        string name  - The name for the mesh
+        array points - (M, 3) array with the points of all lines after
+                       each other, or (N, R, 3) when all lines have R points
+        array counts - (N,) array with the number of points per line
+    """
+
+    points = numpy.asarray(points, dtype=numpy.float32)
+    if counts is None:
+        counts = numpy.full(len(points), points.shape[1], dtype=numpy.int64)
+        points = points.reshape(-1, 3)
+    counts = numpy.asarray(counts, dtype=numpy.int64)
+
+    # Connect every point to the next one, except the last point of a line.
+    line_ends = numpy.cumsum(counts) - 1
+    starts = numpy.ones(len(points), dtype=numpy.bool_)
+    starts[line_ends[counts > 0]] = False
+    starts = numpy.flatnonzero(starts).astype(numpy.int32)
+    edges = numpy.column_stack((starts, starts + 1))
+
+    mesh = bpy.data.meshes.new(name)
+    mesh.vertices.add(len(points))
+    mesh.vertices.foreach_set('co', points.ravel())
+    mesh.edges.add(len(edges))
+    mesh.edges.foreach_set('vertices', edges.ravel())
+    mesh.update()
+
+    return mesh
+
+
+def add_wire_material(obj, name='wire'):
+    """
+    add_wire_material(object obj, string name) -> material material
+
+        Adds a material which renders the edges as wires (Blender Internal)
+        to a wire mesh (see create_wire_mesh), so the mesh can be rendered
+        without a skin modifier or bevel. The material is shared by all
+        wire meshes.
+
+        object obj  - the wire object
+        string name - the name of the material
+    """
+
+    material = bpy.data.materials.get(name)
+    if material is None:
+        material = bpy.data.materials.new(name)
+        material.type = 'WIRE'
+    obj.data.materials.append(material)
+
+    return material
+
+
 ##############################################################################
-## Function to get points on a nurbs spline. (Thanks to Pink Vertex.)
-## Needs evaluation, cleanup and bladiebla, bla bla bla. But works fine!
+## Functions to get points on a nurbs spline. (Thanks to Pink Vertex.)
+## The knot and basis functions are a port of the ones in Blender's curve.c.
 ##############################################################################
 
-def get_nurbs_points(spline_points=None, curve=None,
-                     curve_obj=None, spline_index=0, world_space=False):
+def macro_knotsu(use_cyclic_u, order_u, point_count_u):
+    if use_cyclic_u:
+        return order_u + point_count_u + (order_u - 1)
+    else:
+        return order_u + point_count_u + order_u
+
+
+def macro_segmentsu(use_cyclic_u, point_count_u):
+    if use_cyclic_u:
+        return point_count_u
+    else:
+        return point_count_u - 1
+
+
+def makeknots(use_cyclic_u, order_u, point_count_u,
+              use_endpoint_u, use_bezier_u):
+    knots = [0.0] * (4 + macro_knotsu(use_cyclic_u,
+                                      order_u,
+                                      point_count_u))
+    flag = use_endpoint_u + (use_bezier_u << 1)
+    if use_cyclic_u:
+        calcknots(knots, point_count_u, order_u, 0)
+        makecyclicknots(knots, point_count_u, order_u)
+    else:
+        calcknots(knots, point_count_u, order_u, flag)
+    return knots
+
+
+def calcknots(knots, pnts, order, flag):
+    pnts_order = pnts + order
+    if flag == 1:
+        k = 0.0
+        for a in range(1, pnts_order + 1):
+            knots[a - 1] = k
+            if a >= order and a <= pnts:
+                k += 1.0
+    elif flag == 2:
+        if order == 4:
+            k = 0.34
+            for a in range(pnts_order):
+                knots[a] = math.floor(k)
+                k += (1.0 / 3.0)
+        elif order == 3:
+            k = 0.6
+            for a in range(pnts_order):
+                if a >= order and a <= pnts:
+                    k += 0.5
+                knots[a] = math.floor(k)
+    else:
+        for a in range(pnts_order):
+            knots[a] = a
 
-    def macro_knotsu(use_cyclic_u, order_u, point_count_u):
-        if use_cyclic_u:
-            return order_u + point_count_u + (order_u - 1)
-        else:
-            return order_u + point_count_u + order_u
 
-    def macro_segmentsu(use_cyclic_u, point_count_u):
-        if use_cyclic_u:
-            return point_count_u
-        else:
-            return point_count_u - 1
-
-    def makeknots(use_cyclic_u, order_u, point_count_u,
-                  use_endpoint_u, use_bezier_u):
-        knots = [0.0] * (4 + macro_knotsu(use_cyclic_u,
-                                          order_u,
-                                          point_count_u))
-        flag = use_endpoint_u + (use_bezier_u << 1)
-        if use_cyclic_u:
-            calcknots(knots, point_count_u, order_u, 0)
-            makecyclicknots(knots, point_count_u, order_u)
-        else:
-            calcknots(knots, point_count_u, order_u, flag)
-        return knots
-
-    def calcknots(knots, pnts, order, flag):
-        pnts_order = pnts + order
-        if flag == 1:
-            k = 0.0
-            for a in range(1, pnts_order + 1):
-                knots[a - 1] = k
-                if a >= order and a <= pnts:
-                    k += 1.0
-        elif flag == 2:
-            if order == 4:
-                k = 0.34
-                for a in range(pnts_order):
-                    knots[a] = math.floor(k)
-                    k += (1.0 / 3.0)
-            elif order == 3:
-                k = 0.6
-                for a in range(pnts_order):
-                    if a >= order and a <= pnts:
-                        k += 0.5
-                        knots[a] = math.floor(k)
-        else:
-            for a in range(pnts_order):
-                knots[a] = a
-
-    def makecyclicknots(knots, pnts, order):
-        order2 = order - 1
-
-        if order > 2:
-            b = pnts + order2
-            for a in range(1, order2):
-                if knots[b] != knots[b - a]:
-                    break
-
-                if a == order2:
-                    knots[pnts + order - 2] += 1.0
-
-        b = order
-        c = pnts + order + order2
-        for a in range(pnts + order2, c):
-            knots[a] = knots[a - 1] + (knots[b] - knots[b - 1])
-            b -= 1
-
-    def basisNurb(t, order, pnts, knots, basis, start, end):
-        i1 = i2 = 0
-        orderpluspnts = order + pnts
-        opp2 = orderpluspnts - 1
-
-        # this is for float inaccuracy
-        if t < knots[0]:
-            t = knots[0]
-        elif t > knots[opp2]:
-            t = knots[opp2]
-
-        # this part is order '1'
-        o2 = order + 1
-        for i in range(opp2):
-            if knots[i] != knots[i + 1] and t >= knots[i] and t <= knots[i + 1]:
-                basis[i] = 1.0
-                i1 = i - o2
-                if i1 < 0:
-                    i1 = 0
-                i2 = i
-                i += 1
-                while i < opp2:
-                    basis[i] = 0.0
-                    i += 1
+def makecyclicknots(knots, pnts, order):
+    order2 = order - 1
+
+    if order > 2:
+        b = pnts + order2
+        for a in range(1, order2):
+            if knots[b] != knots[b - a]:
                 break
 
-            else:
+            if a == order2:
+                knots[pnts + order - 2] += 1.0
+
+    b = order
+    c = pnts + order + order2
+    for a in range(pnts + order2, c):
+        knots[a] = knots[a - 1] + (knots[b] - knots[b - 1])
+        b -= 1
+
+
+def basisNurb(t, order, pnts, knots, basis, start, end):
+    i1 = i2 = 0
+    orderpluspnts = order + pnts
+    opp2 = orderpluspnts - 1
+
+    # this is for float inaccuracy
+    if t < knots[0]:
+        t = knots[0]
+    elif t > knots[opp2]:
+        t = knots[opp2]
+
+    # this part is order '1'
+    o2 = order + 1
+    for i in range(opp2):
+        if knots[i] != knots[i + 1] and t >= knots[i] and t <= knots[i + 1]:
+            basis[i] = 1.0
+            i1 = i - o2
+            if i1 < 0:
+                i1 = 0
+            i2 = i
+            i += 1
+            while i < opp2:
                 basis[i] = 0.0
+                i += 1
+            break
 
-        basis[i] = 0.0
+        else:
+            basis[i] = 0.0
 
-        # this is order 2, 3, ...
-        for j in range(2, order + 1):
+    basis[i] = 0.0
 
-            if i2 + j >= orderpluspnts:
-                i2 = opp2 - j
+    # this is order 2, 3, ...
+    for j in range(2, order + 1):
 
-            for i in range(i1, i2 + 1):
-                if basis[i] != 0.0:
-                    d = ((t - knots[i]) * basis[i]) / (knots[i + j - 1] - knots[i])
-                else:
-                    d = 0.0
+        if i2 + j >= orderpluspnts:
+            i2 = opp2 - j
 
-                if basis[i + 1] != 0.0:
-                    e = ((knots[i + j] - t) * basis[i + 1]) / \
-                        (knots[i + j] - knots[i + 1])
-                else:
-                    e = 0.0
+        for i in range(i1, i2 + 1):
+            if basis[i] != 0.0:
+                d = ((t - knots[i]) * basis[i]) / (knots[i + j - 1] - knots[i])
+            else:
+                d = 0.0
 
-                basis[i] = d + e
+            if basis[i + 1] != 0.0:
+                e = ((knots[i + j] - t) * basis[i + 1]) / \
+                    (knots[i + j] - knots[i + 1])
+            else:
+                e = 0.0
+
+            basis[i] = d + e
+
+    start = 1000
+    end = 0
+
+    for i in range(i1, i2 + 1):
+        if basis[i] > 0.0:
+            end = i
+            if start == 1000:
+                start = i
+
+    return start, end
+
+
+# The knots and basis only depend on the settings of a spline, not on its
+# points. Keep the most recently used ones around, so tessellating a lot of
+# splines (with a few distinct settings) only calculates them once per
+# configuration.
+NURBS_CACHE_SIZE = 256
+
+
+@functools.lru_cache(maxsize=NURBS_CACHE_SIZE)
+def nurbs_knots_cached(use_cyclic_u, order_u, point_count_u,
+                       use_endpoint_u, use_bezier_u):
+    return tuple(makeknots(use_cyclic_u, order_u, point_count_u,
+                           use_endpoint_u, use_bezier_u))
+
+
+@functools.lru_cache(maxsize=NURBS_CACHE_SIZE)
+def nurbs_basis_cached(order_u, point_count_u, resolution_u,
+                       use_cyclic_u, use_endpoint_u, use_bezier_u):
+    segments_u = macro_segmentsu(use_cyclic_u, point_count_u)
+    knots = nurbs_knots_cached(use_cyclic_u, order_u, point_count_u,
+                               use_endpoint_u, use_bezier_u)
+    basisu = [0.0] * macro_knotsu(use_cyclic_u, order_u, point_count_u)
+
+    resolu = max(resolution_u * segments_u, 1)
+    ustart = knots[order_u - 1]
+    if use_cyclic_u:
+        uend = knots[point_count_u + order_u - 1]
+        ustep = (uend - ustart) / resolu
+        cycl = order_u - 1
+    else:
+        uend = knots[point_count_u]
+        ustep = (uend - ustart) / max(resolu - 1, 1)
+        cycl = 0
+
+    basis = numpy.zeros((resolu, point_count_u))
+    istart = iend = 0
+    u = ustart
+    for r in range(resolu):
+        istart, iend = basisNurb(u,
+                                 order_u,
+                                 point_count_u + cycl,
+                                 knots,
+                                 basisu,
+                                 istart,
+                                 iend)
+        for i in range(istart, iend + 1):
+            basis[r, i % point_count_u] += basisu[i]
+        u += ustep
+
+    # The array is shared by everyone hitting the cache.
+    basis.flags.writeable = False
+
+    return basis
+
+
+def get_nurbs_knots(order_u=3,
+                    point_count_u=3,
+                    use_cyclic_u=False,
+                    use_endpoint_u=True,
+                    use_bezier_u=False):
+    """
+    get_nurbs_knots(int order_u, int point_count_u, bool use_cyclic_u,
+                    bool use_endpoint_u, bool use_bezier_u)
+            -> tuple of float knots
 
-        start = 1000
-        end = 0
+        Returns the (cached) knot vector of a spline with these settings.
+    """
 
-        for i in range(i1, i2 + 1):
-            if basis[i] > 0.0:
-                end = i
-                if start == 1000:
-                    start = i
+    return nurbs_knots_cached(bool(use_cyclic_u), int(order_u),
+                              int(point_count_u), bool(use_endpoint_u),
+                              bool(use_bezier_u))
 
-        return start, end
 
-    def nurb_make_curve(resolu, stride, nu=None, points=None):
-        if not nu and not points:
-            return
+def get_nurbs_basis(order_u=3,
+                    point_count_u=3,
+                    resolution_u=12,
+                    use_cyclic_u=False,
+                    use_endpoint_u=True,
+                    use_bezier_u=False):
+    """
+    get_nurbs_basis(int order_u, int point_count_u, int resolution_u,
+                    bool use_cyclic_u, bool use_endpoint_u,
+                    bool use_bezier_u) -> numpy array basis
+
+        Evaluates the (non rational) NURBS basis functions at every sample
+        Blender would tessellate a spline with these settings at. The result
+        has the shape (resolution_u * segments, point_count_u), so the
+        tessellated points of a non rational spline are basis @ points.
+        For cyclic splines the wrapped basis functions are folded back onto
+        the control point they belong to.
+        The result is cached per configuration and is read only.
+    """
 
-        if nu:
-            resolution_u = nu.resolution_u
-            point_count_u = nu.point_count_u
-            order_u = nu.order_u
-            use_cyclic_u = nu.use_cyclic_u
-            points = [p.co for p in nu.points]
-            use_endpoint_u = nu.use_endpoint_u
-            use_bezier_u = nu.use_bezier_u
-        else:
-            # Values are the values I want for now :)
-            resolution_u = 12
-            point_count_u = len(points)
-            order_u = 3
-            use_cyclic_u = False
-            points = points
-            use_endpoint_u = True
-            use_bezier_u = False
-        macro_segments_u = macro_segmentsu(use_cyclic_u, point_count_u)
-        macro_knots_u = macro_knotsu(use_cyclic_u, order_u, point_count_u)
-        knots = makeknots(use_cyclic_u, order_u, point_count_u,
-                          use_endpoint_u, use_bezier_u)
-
-        EPS = 1e-6
-        coord_index = istart = iend = 0
-
-        coord_array = [0.0] * (3 * resolution_u * macro_segments_u)
-        sum_array = [0] * point_count_u
-        basisu = [0.0] * macro_knots_u
-
-        resolu = resolu * macro_segments_u
-        ustart = knots[order_u - 1]
-        if use_cyclic_u:
-            uend = knots[point_count_u + order_u - 1]
-            ustep = (uend - ustart) / resolu
-            cycl = order_u - 1
-        else:
-            uend = knots[point_count_u]
-            ustep = (uend - ustart) / (resolu - 1)
-            cycl = 0
-
-        u = ustart
-        while resolu:
-            resolu -= 1
-            istart, iend = basisNurb(u,
-                                     order_u,
-                                     point_count_u + cycl,
-                                     knots,
-                                     basisu,
-                                     istart,
-                                     iend)
-
-            #/* calc sum */
-            sumdiv = 0.0
-            sum_index = 0
-            pt_index = istart - 1
-            for i in range(istart, iend + 1):
-                if i >= point_count_u:
-                    pt_index = i - point_count_u
-                else:
-                    pt_index += 1
-
-                sum_array[sum_index] = basisu[i] * points[pt_index][3]
-                sumdiv += sum_array[sum_index]
-                sum_index += 1
-
-            if (sumdiv != 0.0) and (sumdiv < 1.0 - EPS or sumdiv > 1.0 + EPS):
-                sum_index = 0
-                for i in range(istart, iend + 1):
-                    sum_array[sum_index] /= sumdiv
-                    sum_index += 1
-
-            coord_array[coord_index: coord_index + 3] = (0.0, 0.0, 0.0)
-
-            sum_index = 0
-            pt_index = istart - 1
-            for i in range(istart, iend + 1):
-                if i >= point_count_u:
-                    pt_index = i - point_count_u
-                else:
-                    pt_index += 1
-
-                if sum_array[sum_index] != 0.0:
-                    for j in range(3):
-                        coord_array[coord_index + j] += sum_array[sum_index] * points[pt_index][j]
-                sum_index += 1
-
-            coord_index += stride
-            u += ustep
-
-        return coord_array
+    # Normalize the arguments, so RNA values and python values share
+    # the same cache entries.
+    return nurbs_basis_cached(int(order_u), int(point_count_u),
+                              int(resolution_u), bool(use_cyclic_u),
+                              bool(use_endpoint_u), bool(use_bezier_u))
+
+
+def get_nurbs_cache_info():
+    """
+    get_nurbs_cache_info() -> dict info
+
+        Returns the hits, misses, maxsize and currsize of the knot and basis
+        caches, to check if the caches are doing their job.
+    """
+
+    return {"knots": nurbs_knots_cached.cache_info()._asdict(),
+            "basis": nurbs_basis_cached.cache_info()._asdict()}
+
+
+def clear_nurbs_cache():
+    """
+    clear_nurbs_cache()
+
+        Empties the knot and basis caches and resets their counters.
+    """
+
+    nurbs_knots_cached.cache_clear()
+    nurbs_basis_cached.cache_clear()
+
+
+def get_spline_settings(curve, spline):
+    """
+    get_spline_settings(curve curve, spline spline) -> tuple settings
+
+        Returns the settings which determine the basis of a NURBS spline,
+        in the order get_nurbs_basis takes them. Like Blender the render
+        resolution of the curve is used if it is set, otherwise the
+        resolution of the spline.
+    """
+
+    if curve.render_resolution_u:
+        resolution = curve.render_resolution_u
+    else:
+        resolution = spline.resolution_u
+    point_count = len(spline.points)
+
+    return (min(spline.order_u, point_count),
+            point_count,
+            resolution,
+            spline.use_cyclic_u,
+            spline.use_endpoint_u,
+            spline.use_bezier_u)
+
+
+def get_spline_control_points(spline):
+    """
+    get_spline_control_points(spline spline) -> numpy array control_points
+
+        Returns the (P, 4) homogeneous control points of a NURBS spline.
+    """
+
+    control_points = numpy.zeros(len(spline.points) * 4)
+    spline.points.foreach_get('co', control_points)
+    control_points.shape = (len(spline.points), 4)
+
+    return control_points
+
+
+def get_curve_points(curve):
+    """
+    get_curve_points(curve curve) -> list of numpy array points
+
+        Tessellates all NURBS splines of a curve and returns a (R, 3) array
+        of points per spline. The splines are grouped by their settings,
+        so every distinct configuration is tessellated in one batch and its
+        basis is only looked up once.
+
+        curve curve - the curve (data) to tessellate
+    """
+
+    groups = {}
+    for i, spline in enumerate(curve.splines):
+        if spline.type != 'NURBS' or not len(spline.points) > 1:
+            continue
+        settings = get_spline_settings(curve, spline)
+        groups.setdefault(settings, []).append(i)
+
+    points = [None] * len(curve.splines)
+    for settings, indices in groups.items():
+        control_points = numpy.array([
+            get_spline_control_points(curve.splines[i]) for i in indices])
+        basis = get_nurbs_basis(*settings)
+        group_points = evaluate_nurbs_basis(basis, control_points)
+        for i, p in zip(indices, group_points):
+            points[i] = p
+
+    return points
+
+
+def evaluate_nurbs_basis(basis, control_points):
+    """
+    evaluate_nurbs_basis(numpy array basis, numpy array control_points)
+            -> numpy array points
+
+        Applies a basis (see get_nurbs_basis) to an (N, P, 4) array of
+        homogeneous control points and returns the (N, R, 3) tessellated
+        points. Splines that are not rational (all weights 1.0) are done with
+        a single matrix multiply, like Blender the weighted sums are only
+        normalized when they are not already (close to) 1.0.
+
+        numpy array basis          - (R, P) array with the basis weights
+        numpy array control_points - (N, P, 4) array with the control points
+    """
+
+    EPS = 1e-6
+    coords = control_points[..., :3]
+    weights = control_points[..., 3]
+    if numpy.all(weights == 1.0):
+        return numpy.einsum('rp,npk->nrk', basis, coords)
+
+    weighted = basis[numpy.newaxis] * weights[:, numpy.newaxis, :]
+    sumdiv = weighted.sum(axis=2, keepdims=True)
+    normalize = (sumdiv != 0.0) & (numpy.abs(sumdiv - 1.0) > EPS)
+    weighted = numpy.where(normalize,
+                           weighted / numpy.where(normalize, sumdiv, 1.0),
+                           weighted)
+    return numpy.einsum('nrp,npk->nrk', weighted, coords)
+
+
+def get_nurbs_points_batch(control_points,
+                           order_u=3,
+                           resolution_u=12,
+                           use_cyclic_u=False,
+                           use_endpoint_u=True,
+                           use_bezier_u=False):
+    """
+    get_nurbs_points_batch(array control_points, int order_u,
+                           int resolution_u, bool use_cyclic_u,
+                           bool use_endpoint_u, bool use_bezier_u)
+            -> numpy array points
+
+        Tessellates N NURBS splines which all share the same settings at
+        once. The basis is only calculated once and the points of all
+        splines are calculated with one matrix multiply.
+
+        array control_points - (N, P, 4) array with the control points,
+                               (N, P, 3) is also accepted (all weights 1.0)
+        int order_u          - the order of the splines
+        int resolution_u     - the resolution per segment
+        bool use_cyclic_u    - whether the splines are cyclic
+        bool use_endpoint_u  - whether the splines touch their end points
+        bool use_bezier_u    - whether the splines act like bezier splines
+
+        Returns an (N, R, 3) array, where R is resolution_u * segments.
+    """
+
+    control_points = numpy.asarray(control_points, dtype=numpy.float64)
+    if control_points.ndim != 3 or control_points.shape[2] not in {3, 4}:
+        print("Control points need to be an (N, P, 4) array, "
+              "got shape {}".format(control_points.shape))
+        return
+    if control_points.shape[2] == 3:
+        weights = numpy.ones(control_points.shape[:2] + (1,))
+        control_points = numpy.concatenate((control_points, weights), axis=2)
+
+    point_count_u = control_points.shape[1]
+    basis = get_nurbs_basis(order_u=min(order_u, point_count_u),
+                            point_count_u=point_count_u,
+                            resolution_u=resolution_u,
+                            use_cyclic_u=use_cyclic_u,
+                            use_endpoint_u=use_endpoint_u,
+                            use_bezier_u=use_bezier_u)
+
+    return evaluate_nurbs_basis(basis, control_points)
+
+
+def tessellate_splines(control_points, resolutions, **settings):
+    """
+    tessellate_splines(array control_points, array resolutions, **settings)
+            -> tuple (numpy array points, numpy array counts)
+
+        Tessellates N NURBS splines which share their settings, but each
+        have their own resolution. The splines are done in one batch per
+        distinct resolution. Returns the (M, 3) points of all splines after
+        each other and the (N,) number of points per spline.
+
+        array control_points - (N, P, 4) or (N, P, 3) array of control points
+        array resolutions    - (N,) array with the resolution per spline
+    """
+
+    control_points = numpy.asarray(control_points, dtype=numpy.float64)
+    values = resolutions
+    resolutions = numpy.empty(len(control_points), dtype=numpy.int64)
+    resolutions[:] = values
+    point_count_u = control_points.shape[1]
+    counts = resolutions * macro_segmentsu(settings.get("use_cyclic_u",
+                                                        False),
+                                           point_count_u)
+    counts = numpy.maximum(counts, 1).astype(numpy.int64)
+    offsets = numpy.concatenate(((0,), numpy.cumsum(counts)))
+    points = numpy.zeros((offsets[-1], 3))
+    for resolution in numpy.unique(resolutions):
+        indices = numpy.flatnonzero(resolutions == resolution)
+        group_points = get_nurbs_points_batch(control_points[indices],
+                                              resolution_u=int(resolution),
+                                              **settings)
+        # Every spline in the group has the same number of points.
+        targets = (offsets[indices][:, numpy.newaxis] +
+                   numpy.arange(group_points.shape[1]))
+        points[targets.ravel()] = group_points.reshape(-1, 3)
+
+    return points, counts
+
+
+def get_nurbs_points(spline_points=None, curve=None,
+                     curve_obj=None, spline_index=0, world_space=False):
+    """
+    get_nurbs_points(list of vector spline_points, curve curve,
+                     object curve_obj, int spline_index, bool world_space)
+            -> list of vector points
+
+        Tessellates a single NURBS spline, either from the given points
+        (order 3, endpoint, resolution 12) or from the spline at
+        spline_index on the given curve.
+    """
 
     if not spline_points and not curve:
         return
 
     if curve:
         spline = curve.splines[spline_index]
-        if curve.render_resolution_u:
-            resolution = curve.render_resolution_u
-        else:
-            resolution = curve.resolution_u
-        coord_array = nurb_make_curve(resolution, 3, nu=spline)
+        basis = get_nurbs_basis(*get_spline_settings(curve, spline))
+        control_points = get_spline_control_points(spline)
+        points = evaluate_nurbs_basis(basis, control_points[numpy.newaxis])
 
     else:   # spline_points are given
-        resolution = 12
-        spline_points = [p.to_4d() for p in spline_points]
-        coord_array = nurb_make_curve(resolution, 3, points=spline_points)
+        control_points = [[tuple(p.to_4d()) for p in spline_points]]
+        points = get_nurbs_points_batch(control_points)
 
-    points = [mathutils.Vector(coord_array[i: i + 3])
-              for i in range(0, len(coord_array), 3)]
+    points = [mathutils.Vector(p) for p in points[0]]
 
     if world_space and curve_obj:
         matrix_world = curve_obj.matrix_world
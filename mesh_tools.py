@@ -17,59 +17,458 @@
 # ##### END GPL LICENSE BLOCK #####
 
 
+import os
 import math
-import random
+import collections
+import concurrent.futures
+import numpy
 import bpy
 import bpy_extras.mesh_utils
 from mathutils import Vector
+from mathutils.bvhtree import BVHTree
+from mathutils.geometry import tessellate_polygon
+from . import random_tools
 
 
-def get_random_points_on_verts(mesh, amount, transform_matrix, seed=0):
+# The geometry of evaluated meshes, per object name (see get_mesh_data). The
+# least recently used entries are dropped when the arrays take more memory
+# than MESH_CACHE_MAX_BYTES.
+MESH_CACHE = collections.OrderedDict()
+MESH_CACHE_MAX_BYTES = 512 * 1024 * 1024
+MESH_CACHE_STATS = {"hits": 0, "misses": 0}
+
+
+def get_rna_signature(struct):
+    """
+    get_rna_signature(struct struct) -> tuple signature
+
+        Returns a hashable tuple with the values of all properties of an RNA
+        struct (a modifier for example). Referenced objects are included by
+        name and world matrix (and the matrices of their pose bones, for
+        armatures).
+    """
+
+    values = []
+    for prop in struct.bl_rna.properties:
+        if prop.identifier == 'rna_type' or prop.type == 'COLLECTION':
+            continue
+        value = getattr(struct, prop.identifier, None)
+        if prop.type == 'POINTER':
+            if hasattr(value, 'matrix_world'):
+                pose = value.pose
+                value = (value.name,
+                         tuple(tuple(row) for row in value.matrix_world))
+                if pose is not None:
+                    value += (tuple(tuple(row) for bone in pose.bones
+                                    for row in bone.matrix),)
+            else:
+                value = getattr(value, 'name', None)
+        elif isinstance(value, set):
+            value = frozenset(value)
+        elif hasattr(value, '__len__') and not isinstance(value, str):
+            value = tuple(value)
+        values.append((prop.identifier, value))
+
+    return tuple(values)
+
+
+def get_mesh_signature(obj, apply_modifiers=True):
+    """
+    get_mesh_signature(object obj, bool apply_modifiers) -> tuple signature
+
+        Returns a signature which changes when the (evaluated) geometry of
+        the object might have changed: the name, vertex positions and
+        element counts of its mesh and, if modifiers are applied, its shape
+        keys (see get_shape_key_signature), the settings of its modifiers
+        (and the objects they use) and the current frame. Only names and
+        contents, so the signature survives undo (which moves all data).
+    """
+
+    data = obj.data
+    co = numpy.zeros(len(data.vertices) * 3, dtype=numpy.float32)
+    data.vertices.foreach_get('co', co)
+    signature = (data.name,
+                 len(data.vertices),
+                 len(data.edges),
+                 len(data.polygons),
+                 hash(co.tobytes()))
+    if apply_modifiers:
+        signature += get_shape_key_signature(data)
+    if apply_modifiers and obj.modifiers:
+        signature += (bpy.context.scene.frame_current,)
+        signature += tuple(get_rna_signature(m) for m in obj.modifiers)
+
+    return signature
+
+
+def get_shape_key_signature(mesh):
+    """
+    get_shape_key_signature(mesh mesh) -> tuple signature
+
+        Returns a signature of the shape keys of the mesh: the settings and
+        (hashed) coordinates of every key block. Empty if the mesh has no
+        shape keys.
+    """
+
+    shape_keys = mesh.shape_keys
+    if shape_keys is None:
+        return ()
+    signature = [shape_keys.use_relative, shape_keys.eval_time]
+    co = numpy.zeros(len(mesh.vertices) * 3, dtype=numpy.float32)
+    for block in shape_keys.key_blocks:
+        block.data.foreach_get('co', co)
+        signature.append((block.name,
+                          block.value,
+                          block.mute,
+                          block.relative_key.name,
+                          block.vertex_group,
+                          hash(co.tobytes())))
+
+    return tuple(signature)
+
+
+def get_density_signature(obj, density):
+    """
+    get_density_signature(object obj, tuple density) -> int signature
+
+        Returns a hash of the weights of the density source (see
+        read_density) in the mesh of the object, which changes when they are
+        painted. None if the object doesn't have the source.
+    """
+
+    source, name = density
+    if source == 'VERTEX_GROUP':
+        group = obj.vertex_groups.get(name)
+        if group is None:
+            return
+        weights = read_vertex_group_weights(obj.data, group.index)
+    else:
+        weights = read_face_weights(obj.data, name)
+        if weights is None:
+            return
+
+    return hash(weights.tobytes())
+
+
+def get_object_signature(obj, apply_modifiers=True, density=None):
+    """
+    get_object_signature(object obj, bool apply_modifiers, tuple density)
+            -> tuple signature
+
+        Returns a signature which changes when the (evaluated) geometry of
+        the mesh object in world space might have changed: its name, world
+        matrix and mesh signature (see get_mesh_signature), and the weights
+        of the density source if given (see get_density_signature).
+    """
+
+    signature = (obj.name,
+                 tuple(tuple(row) for row in obj.matrix_world),
+                 get_mesh_signature(obj, apply_modifiers))
+    if density is not None:
+        signature += (get_density_signature(obj, density),)
+
+    return signature
+
+
+def get_mesh_arrays(mesh):
+    """
+    get_mesh_arrays(mesh mesh) -> dict mesh_data
+
+        Reads the geometry of the mesh into numpy arrays:
+            "verts"             - (V, 3) vertex coordinates
+            "edges"             - (E, 2) vertex indices
+            "edge_lengths"      - (E,) edge lengths
+            "triangles"         - (T, 3) vertex indices
+            "triangle_polygons" - (T,) polygon index per triangle
+            "areas"             - (T,) triangle areas
+        And three (initially empty) dictionaries, "densities" with the
+        density per triangle, "density_signatures" with the signature of the
+        weights it was read from (see get_density_signature) and
+        "alias_tables" with the sampling index, per density source (see
+        get_surface_alias_table).
+    """
+
+    verts, triangles, polygons = get_mesh_triangles(mesh)
+    edges = numpy.zeros(len(mesh.edges) * 2, dtype=numpy.int64)
+    mesh.edges.foreach_get('vertices', edges)
+    edges.shape = (len(mesh.edges), 2)
+
+    return {"verts": verts,
+            "edges": edges,
+            "edge_lengths": get_edge_lengths(verts, edges),
+            "triangles": triangles,
+            "triangle_polygons": polygons,
+            "areas": get_triangle_areas(verts, triangles),
+            "densities": {},
+            "density_signatures": {},
+            "alias_tables": {}}
+
+
+def get_mesh_data_size(mesh_data):
+    """
+    get_mesh_data_size(dict mesh_data) -> int size
+
+        Returns the (approximate) memory in bytes the mesh data takes.
+    """
+
+    size = 0
+    for value in mesh_data.values():
+        if isinstance(value, numpy.ndarray):
+            size += value.nbytes
+        elif isinstance(value, BVHTree):
+            # Roughly what the tree needs per triangle
+            size += len(mesh_data["triangles"]) * 64
+        elif isinstance(value, dict):
+            # Arrays or tuples of arrays (the signatures are not counted)
+            for item in value.values():
+                for array in (item if isinstance(item, tuple) else (item,)):
+                    if isinstance(array, numpy.ndarray):
+                        size += array.nbytes
+
+    return size
+
+
+def get_mesh_data(obj, apply_modifiers=True, density=None,
+                  density_signature=None):
+    """
+    get_mesh_data(object obj, bool apply_modifiers, tuple density,
+                  int density_signature) -> dict mesh_data
+
+        Returns the geometry arrays of the object (see get_mesh_arrays), in
+        object space. The arrays are cached per object until its mesh or
+        modifiers change, so the modifier stack is only evaluated again when
+        needed. The temporary mesh is removed as soon as the arrays are
+        read. Samplers may store extra data (a BVH tree for example) in the
+        returned dictionary, it is kept as long as the geometry is cached.
+        The density is read again when its weights changed.
+
+        object obj            - the object to get the geometry from
+        bool apply_modifiers  - use the deformed or original mesh
+        tuple density         - also read this density source (see
+                                read_density) into mesh_data["densities"]
+        int density_signature - the signature of the density weights, if
+                                already known (see get_density_signature)
+    """
+
+    # By name, as undo (which the redo panel does first) moves every object
+    # in memory. The signature tells if the geometry is still the same.
+    key = (obj.name, apply_modifiers)
+    signature = get_mesh_signature(obj, apply_modifiers)
+    if density is not None and density_signature is None:
+        density_signature = get_density_signature(obj, density)
+    cached = MESH_CACHE.get(key)
+    if cached and cached[0] == signature:
+        MESH_CACHE.move_to_end(key)
+        MESH_CACHE_STATS["hits"] += 1
+        mesh_data = cached[1]
+        if (density is None or
+                density in mesh_data["densities"] and
+                mesh_data["density_signatures"][density] ==
+                density_signature):
+            return mesh_data
+    else:
+        MESH_CACHE_STATS["misses"] += 1
+        mesh_data = None
+
+    if apply_modifiers:
+        mesh = obj.to_mesh(bpy.context.scene, True, 'PREVIEW')
+    else:
+        mesh = obj.data.copy()
+    try:
+        if mesh_data is None:
+            mesh_data = get_mesh_arrays(mesh)
+        if density is not None:
+            mesh_data["densities"][density] = read_density(obj, mesh,
+                                                           mesh_data,
+                                                           density)
+            mesh_data["density_signatures"][density] = density_signature
+            mesh_data["alias_tables"].pop(density, None)
+    finally:
+        bpy.data.meshes.remove(mesh)
+
+    MESH_CACHE[key] = (signature, mesh_data)
+    MESH_CACHE.move_to_end(key)
+    trim_mesh_cache()
+
+    return mesh_data
+
+
+def trim_mesh_cache(max_bytes=None):
+    """
+    trim_mesh_cache(int max_bytes)
+
+        Drops the least recently used geometry from the cache until it
+        takes less than max_bytes (MESH_CACHE_MAX_BYTES by default). The
+        most recently used entry is always kept.
+    """
+
+    if max_bytes is None:
+        max_bytes = MESH_CACHE_MAX_BYTES
+    sizes = [get_mesh_data_size(data) for _, data in MESH_CACHE.values()]
+    total = sum(sizes)
+    for size in sizes[:-1]:
+        if total <= max_bytes:
+            break
+        MESH_CACHE.popitem(last=False)
+        total -= size
+
+
+def clear_mesh_cache():
+    """
+    clear_mesh_cache()
+
+        Empties the geometry cache and resets its counters.
+    """
+
+    MESH_CACHE.clear()
+    MESH_CACHE_STATS["hits"] = 0
+    MESH_CACHE_STATS["misses"] = 0
+
+
+def get_mesh_cache_info():
+    """
+    get_mesh_cache_info() -> dict info
+
+        Returns the hits, misses, number of entries and size in bytes of the
+        geometry cache.
+    """
+
+    return {"hits": MESH_CACHE_STATS["hits"],
+            "misses": MESH_CACHE_STATS["misses"],
+            "entries": len(MESH_CACHE),
+            "bytes": sum(get_mesh_data_size(data)
+                         for _, data in MESH_CACHE.values())}
+
+
+def get_bvh_tree(mesh_data):
+    """
+    get_bvh_tree(dict mesh_data) -> BVHTree tree
+
+        Returns the BVH tree of the triangles of the mesh data. The tree is
+        built once and stored with the (cached) mesh data.
+    """
+
+    if "tree" not in mesh_data:
+        mesh_data["tree"] = create_bvh_tree(mesh_data["verts"],
+                                            mesh_data["triangles"])
+
+    return mesh_data["tree"]
+
+
+def get_random_state(seed, *streams):
+    """
+    get_random_state(int seed, int *streams) -> CounterRandom random_state
+
+        Returns a counter based random generator for the seed (see
+        random_tools.CounterRandom). Extra stream numbers (an object index
+        for example) give independent, reproducible streams for the same
+        seed.
+    """
+
+    return random_tools.CounterRandom(seed, *streams)
+
+
+def sample_verts(verts, amount, random_state):
+    """
+    sample_verts(numpy array verts, int amount, CounterRandom random_state)
+            -> numpy array points
+
+        Draws <amount> random vertex coordinates (with replacement).
+    """
+
+    return verts[random_state.randint(0, len(verts), amount)]
+
+
+def get_edge_lengths(verts, edges):
+    """
+    get_edge_lengths(numpy array verts, numpy array edges)
+            -> numpy array lengths
+
+        Returns the length of every edge.
+    """
+
+    return numpy.linalg.norm(verts[edges[:, 1]] - verts[edges[:, 0]], axis=1)
+
+
+def sample_edges(verts, edges, amount, random_state, lengths=None):
+    """
+    sample_edges(numpy array verts, numpy array edges, int amount,
+                 CounterRandom random_state, numpy array lengths)
+            -> numpy array points
+
+        Draws <amount> uniformly distributed points on the edges. The edges
+        are picked weighted by their length, so dense parts of the mesh
+        don't get more points than sparse parts.
+
+        numpy array verts          - (V, 3) array of vertex coordinates
+        numpy array edges          - (E, 2) array of vertex indices
+        int amount                 - the amount of points to return
+        CounterRandom random_state - the random generator to use
+        numpy array lengths        - the (precalculated) edge lengths
     """
-    get_random_points_on_verts(mesh mesh, int amount,
+
+    if lengths is None:
+        lengths = get_edge_lengths(verts, edges)
+    cdf = numpy.cumsum(lengths)
+    if not len(cdf) or cdf[-1] <= 0.0:
+        return numpy.zeros((0, 3))
+
+    picks = numpy.searchsorted(cdf, random_state.random_sample(amount) *
+                               cdf[-1], side='right')
+    picks = numpy.minimum(picks, len(cdf) - 1)
+    v1 = verts[edges[picks, 0]]
+    v2 = verts[edges[picks, 1]]
+    fac = random_state.random_sample(amount)[:, numpy.newaxis]
+
+    return v1 + fac * (v2 - v1)
+
+
+def get_random_points_on_verts(verts, amount, transform_matrix, seed=0):
+    """
+    get_random_points_on_verts(numpy array verts, int amount,
                                matrix transform_matrix, int seed)
             -> list of vector points
 
         Gets <amount> number of random vert coordinates.
 
-        mesh mesh               - the mesh to get the points from
+        numpy array verts       - (V, 3) array with the vertex coordinates
         int amount              - the amount of points to return
         matrix transform_matrix - the matrix to transform the points by
         int seed                - the seed for the randomization
     """
 
-    random.seed(seed)
-    points = []
-    for _ in range(amount):
-        points.append(transform_matrix * random.choice(mesh.vertices).co)
+    random_state = get_random_state(seed)
+    points = sample_verts(verts, amount, random_state)
+    points = transform_points(points, transform_matrix)
 
-    return points
+    return [Vector(p) for p in points]
 
 
-def get_random_points_on_edges(mesh, amount, transform_matrix, seed=0):
+def get_random_points_on_edges(verts, edges, amount, transform_matrix,
+                               seed=0, lengths=None):
     """
-    get_random_points_on_edges(mesh mesh, int amount,
-                               matrix transform_matrix, int seed)
+    get_random_points_on_edges(numpy array verts, numpy array edges,
+                               int amount, matrix transform_matrix, int seed,
+                               numpy array lengths)
             -> list of vector points
 
-        Gets <amount> number of random points on the edges of the mesh.
+        Gets <amount> number of random points on the edges of the mesh,
+        evenly distributed over the total edge length.
 
-        mesh mesh               - the mesh to get the points from
+        numpy array verts       - (V, 3) array with the vertex coordinates
+        numpy array edges       - (E, 2) array with the vertex indices
         int amount              - the amount of points to return
         matrix transform_matrix - the matrix to transform the points by
         int seed                - the seed for the randomization
+        numpy array lengths     - the (precalculated) edge lengths
     """
 
-    random.seed(seed)
-    points = []
-    for _ in range(amount):
-        edge = random.choice(mesh.edges)
-        v1 = mesh.vertices[edge.vertices[0]]
-        v2 = mesh.vertices[edge.vertices[1]]
-        p = v1.co + random.random() * (v2.co - v1.co)
-        points.append(transform_matrix * p)
+    random_state = get_random_state(seed)
+    points = sample_edges(verts, edges, amount, random_state,
+                          lengths=lengths)
+    points = transform_points(points, transform_matrix)
 
-    return points
+    return [Vector(p) for p in points]
 
 
 # def get_random_points_on_surface(mesh, amount, transform_matrix):
@@ -99,32 +498,509 @@ def get_random_points_on_edges(mesh, amount, transform_matrix, seed=0):
 #     return points
 
 
-def get_random_points_on_surface(obj, amount, seed=0):
+def get_mesh_triangles(mesh):
+    """
+    get_mesh_triangles(mesh mesh) -> tuple (numpy array verts,
+                                            numpy array triangles,
+                                            numpy array polygons)
+
+        Reads the vertex coordinates and the triangulated faces of the mesh
+        in bulk. Returns a (V, 3) array of coordinates, a (T, 3) array of
+        vertex indices and a (T,) array with the index of the polygon of
+        every triangle. Quads are split along the diagonal that keeps both
+        triangles inside (they may be concave), larger polygons are
+        tessellated by Blender, so the triangles never overlap.
+
+        mesh mesh - the mesh to read
+    """
+
+    verts = numpy.zeros(len(mesh.vertices) * 3, dtype=numpy.float64)
+    mesh.vertices.foreach_get('co', verts)
+    verts.shape = (len(mesh.vertices), 3)
+
+    loop_starts = numpy.zeros(len(mesh.polygons), dtype=numpy.int64)
+    mesh.polygons.foreach_get('loop_start', loop_starts)
+    loop_totals = numpy.zeros(len(mesh.polygons), dtype=numpy.int64)
+    mesh.polygons.foreach_get('loop_total', loop_totals)
+    loop_verts = numpy.zeros(len(mesh.loops), dtype=numpy.int64)
+    mesh.loops.foreach_get('vertex_index', loop_verts)
+
+    triangles = []
+    polygons = []
+
+    # Triangles as they are
+    tris = numpy.flatnonzero(loop_totals == 3)
+    triangles.append(loop_verts[loop_starts[tris, None] + numpy.arange(3)])
+    polygons.append(tris)
+
+    # Split quads along a-c, unless b and d are on the same side of it (b
+    # or d is a reflex corner), then along b-d
+    quads = numpy.flatnonzero(loop_totals == 4)
+    corners = loop_verts[loop_starts[quads, None] + numpy.arange(4)]
+    a, b, c, d = (verts[corners[:, i]] for i in range(4))
+    normals = numpy.cross(c - a, d - b)
+    side_b = (numpy.cross(c - a, b - a) * normals).sum(axis=1)
+    side_d = (numpy.cross(c - a, d - a) * normals).sum(axis=1)
+    flip = side_b * side_d > 0
+    corners[flip] = numpy.roll(corners[flip], -1, axis=1)
+    triangles.append(corners[:, [0, 1, 2]])
+    triangles.append(corners[:, [0, 2, 3]])
+    polygons.extend((quads, quads))
+
+    # Larger polygons one by one
+    for polygon in numpy.flatnonzero(loop_totals > 4).tolist():
+        start = loop_starts[polygon]
+        indices = loop_verts[start:start + loop_totals[polygon]]
+        tessellated = tessellate_polygon([[Vector(co)
+                                           for co in verts[indices]]])
+        if tessellated:
+            triangles.append(indices[numpy.array(list(tessellated))])
+            polygons.append(numpy.full(len(tessellated), polygon,
+                                       dtype=numpy.int64))
+
+    # In the order of the polygons
+    triangles = numpy.concatenate(triangles).astype(numpy.int64)
+    polygons = numpy.concatenate(polygons).astype(numpy.int64)
+    order = numpy.argsort(polygons, kind='mergesort')
+    triangles = triangles[order]
+    polygons = polygons[order]
+
+    return verts, triangles, polygons
+
+
+def read_vertex_group_weights(mesh, group_index):
+    """
+    read_vertex_group_weights(mesh mesh, int group_index)
+            -> numpy array weights
+
+        Returns the weight of every vertex in the vertex group with the
+        given index (0.0 for vertices which are not in the group).
+    """
+
+    weights = numpy.zeros(len(mesh.vertices))
+    for v in mesh.vertices:
+        for g in v.groups:
+            if g.group == group_index:
+                weights[v.index] = g.weight
+                break
+
+    return weights
+
+
+def read_face_weights(mesh, name):
+    """
+    read_face_weights(mesh mesh, string name) -> numpy array weights
+
+        Returns the values of the float polygon layer with the given name,
+        or nothing if the mesh has no such layer.
+    """
+
+    layer = mesh.polygon_layers_float.get(name)
+    if layer is None:
+        return
+    weights = numpy.zeros(len(mesh.polygons))
+    layer.data.foreach_get('value', weights)
+
+    return weights
+
+
+def read_density(obj, mesh, mesh_data, density):
+    """
+    read_density(object obj, mesh mesh, dict mesh_data, tuple density)
+            -> numpy array weights
+
+        Returns the density of every triangle of the mesh data for the given
+        density source, or nothing if the object doesn't have it.
+
+        tuple density - (source, name), source is 'VERTEX_GROUP' (averaged
+                        over the corners of a triangle) or 'ATTRIBUTE' (a
+                        float polygon layer)
+    """
+
+    source, name = density
+    triangles = mesh_data["triangles"]
+    if source == 'VERTEX_GROUP':
+        group = obj.vertex_groups.get(name)
+        if group is None:
+            return
+        weights = read_vertex_group_weights(mesh, group.index)
+        return weights[triangles].mean(axis=1)
+    if source == 'ATTRIBUTE':
+        weights = read_face_weights(mesh, name)
+        if weights is None:
+            return
+        return weights[mesh_data["triangle_polygons"]]
+
+
+def get_triangle_areas(verts, triangles):
+    """
+    get_triangle_areas(numpy array verts, numpy array triangles)
+            -> numpy array areas
+
+        Returns the area of every triangle.
+    """
+
+    corners = verts[triangles]
+    cross = numpy.cross(corners[:, 1] - corners[:, 0],
+                        corners[:, 2] - corners[:, 0])
+
+    return 0.5 * numpy.linalg.norm(cross, axis=1)
+
+
+def transform_points(points, transform_matrix):
+    """
+    transform_points(numpy array points, matrix transform_matrix)
+            -> numpy array points
+
+        Transforms an (N, 3) array of points by the matrix in one go.
+    """
+
+    matrix = numpy.array(transform_matrix, dtype=numpy.float64)
+
+    return numpy.dot(points, matrix[:3, :3].T) + matrix[:3, 3]
+
+
+def build_alias_table(weights):
+    """
+    build_alias_table(numpy array weights) -> tuple (numpy array prob,
+                                                     numpy array alias)
+
+        Builds a Walker/Vose alias table for the weights, so weighted
+        indices can be drawn in O(1) each (see sample_alias_table). The
+        table is built without a python loop: the deficits of the small
+        entries are laid out after each other and every small entry is
+        filled by the large entry whose surplus covers the start of its
+        deficit. A large entry whose surplus runs out halfway a deficit
+        keeps the rest as its probability and aliases the next large entry.
+    """
+
+    weights = numpy.asarray(weights, dtype=numpy.float64)
+    count = len(weights)
+    total = weights.sum()
+    prob = numpy.ones(count)
+    alias = numpy.arange(count)
+    if not count or total <= 0.0:
+        return prob, alias
+
+    scaled = weights * (count / total)
+    small = numpy.flatnonzero(scaled < 1.0)
+    large = numpy.flatnonzero(scaled >= 1.0)
+    if not len(small) or not len(large):
+        return prob, alias
+
+    deficits = 1.0 - scaled[small]
+    deficit_ends = numpy.cumsum(deficits)
+    deficit_starts = deficit_ends - deficits
+    surplus_ends = numpy.cumsum(scaled[large] - 1.0)
+
+    owners = numpy.searchsorted(surplus_ends, deficit_starts, side='right')
+    owners = numpy.minimum(owners, len(large) - 1)
+    prob[small] = scaled[small]
+    alias[small] = large[owners]
+
+    straddled = numpy.searchsorted(deficit_ends, surplus_ends, side='right')
+    inside = straddled < len(small)
+    straddled = numpy.minimum(straddled, len(small) - 1)
+    inside &= deficit_starts[straddled] < surplus_ends
+    # Rounding errors, the last large entry has nothing left to alias.
+    inside[-1] = False
+    next_large = large[numpy.minimum(numpy.arange(1, len(large) + 1),
+                                     len(large) - 1)]
+    prob[large] = numpy.where(inside,
+                              1.0 - (deficit_ends[straddled] - surplus_ends),
+                              1.0)
+    alias[large] = numpy.where(inside, next_large, large)
+
+    return prob, alias
+
+
+def sample_alias_table(alias_table, amount, random_state):
+    """
+    sample_alias_table(tuple alias_table, int amount,
+                       CounterRandom random_state) -> numpy array indices
+
+        Draws <amount> weighted indices from an alias table (see
+        build_alias_table).
+    """
+
+    prob, alias = alias_table
+    indices = random_state.randint(0, len(prob), amount)
+    keep = random_state.random_sample(amount) < prob[indices]
+
+    return numpy.where(keep, indices, alias[indices])
+
+
+def get_surface_alias_table(mesh_data, density=None):
+    """
+    get_surface_alias_table(dict mesh_data, tuple density)
+            -> tuple alias_table
+
+        Returns the alias table to pick triangles with, weighted by their
+        area times the density (if given and read, see get_mesh_data). The
+        table is built once per density source and stored with the mesh
+        data, so drawing with another seed or amount doesn't rebuild it.
+        Returns nothing if the total weight is zero.
     """
-    get_random_points_on_surface(objet obj, int amount, int seed)
+
+    tables = mesh_data["alias_tables"]
+    weights = mesh_data["areas"]
+    if density is not None:
+        densities = mesh_data["densities"].get(density)
+        if densities is not None:
+            weights = weights * numpy.maximum(densities, 0.0)
+        else:
+            density = None
+    if density not in tables:
+        if not len(weights) or weights.sum() <= 0.0:
+            tables[density] = None
+        else:
+            tables[density] = build_alias_table(weights)
+
+    return tables[density]
+
+
+def sample_surface(verts, triangles, amount, random_state, areas=None,
+                   alias_table=None):
+    """
+    sample_surface(numpy array verts, numpy array triangles, int amount,
+                   CounterRandom random_state, numpy array areas,
+                   tuple alias_table) -> numpy array points
+
+        Draws <amount> points on the triangles. The triangles are picked
+        from the alias table (see get_surface_alias_table), or from the
+        cumulative area distribution if no table is given. The position in
+        the triangle is drawn with uniform barycentric coordinates.
+
+        numpy array verts          - (V, 3) array of vertex coordinates
+        numpy array triangles      - (T, 3) array of vertex indices
+        int amount                 - the amount of points to return
+        CounterRandom random_state - the random generator to use
+        numpy array areas          - the (precalculated) triangle areas
+        tuple alias_table          - the (prebuilt) weighted sampling index
+    """
+
+    if alias_table is not None:
+        picks = sample_alias_table(alias_table, amount, random_state)
+    else:
+        if areas is None:
+            areas = get_triangle_areas(verts, triangles)
+        cdf = numpy.cumsum(areas)
+        if not len(cdf) or cdf[-1] <= 0.0:
+            return numpy.zeros((0, 3))
+        picks = numpy.searchsorted(cdf, random_state.random_sample(amount) *
+                                   cdf[-1], side='right')
+        picks = numpy.minimum(picks, len(cdf) - 1)
+    corners = verts[triangles[picks]]
+    r1 = numpy.sqrt(random_state.random_sample(amount))[:, numpy.newaxis]
+    r2 = random_state.random_sample(amount)[:, numpy.newaxis]
+
+    return ((1.0 - r1) * corners[:, 0] +
+            r1 * (1.0 - r2) * corners[:, 1] +
+            r1 * r2 * corners[:, 2])
+
+
+# The cells around a cell (with sides min_distance / sqrt(3)) which can hold
+# points closer than min_distance. The 8 outer corners are too far away.
+NEIGHBOUR_OFFSETS = numpy.array([(x, y, z)
+                                 for x in range(-2, 3)
+                                 for y in range(-2, 3)
+                                 for z in range(-2, 3)
+                                 if abs(x) + abs(y) + abs(z) < 6])
+
+
+def thin_poisson(candidates, min_distance, random_state,
+                 accepted=None, origin=None, block_size=8192):
+    """
+    thin_poisson(numpy array candidates, float min_distance,
+                 CounterRandom random_state, numpy array accepted,
+                 numpy array origin, int block_size) -> numpy array accepted
+
+        Adds the candidates (in random order) to the accepted points if they
+        are at least min_distance away from all other accepted points.
+        The points are hashed in a uniform grid with cells of
+        min_distance / sqrt(3), so a cell holds at most one point and only
+        the surrounding cells need to be checked. The cells are processed
+        in 27 interleaved phases; cells of the same phase are too far apart
+        to conflict, so every phase is checked at once with arrays.
+
+        numpy array candidates     - (N, 3) array with the candidate points
+        float min_distance         - the minimum distance between the points
+        CounterRandom random_state - the random generator to use
+        numpy array accepted       - (M, 3) array with already accepted points
+        numpy array origin         - the origin of the grid
+        int block_size             - the number of candidates to check at once
+    """
+
+    if accepted is None:
+        accepted = numpy.zeros((0, 3))
+    if not len(candidates):
+        return accepted
+    if origin is None:
+        origin = numpy.concatenate((candidates, accepted)).min(axis=0)
+    cell_size = min_distance / math.sqrt(3.0)
+
+    def get_cells(points):
+        # Pad the grid, so the offsets never wrap around
+        return numpy.floor((points - origin) /
+                           cell_size).astype(numpy.int64) + 2
+
+    dims = get_cells(numpy.concatenate((candidates, accepted))).max(axis=0) + 3
+
+    def get_keys(cells):
+        return (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+
+    offsets = get_keys(NEIGHBOUR_OFFSETS)
+    accepted_keys = get_keys(get_cells(accepted))
+    order = numpy.argsort(accepted_keys, kind='mergesort')
+    accepted = accepted[order]
+    accepted_keys = accepted_keys[order]
+
+    candidates = candidates[random_state.permutation(len(candidates))]
+    cells = get_cells(candidates)
+    keys = get_keys(cells)
+    phases = (cells[:, 0] % 3) * 9 + (cells[:, 1] % 3) * 3 + cells[:, 2] % 3
+    for phase in range(27):
+        # Try the first candidate of every free cell in this phase
+        in_phase = numpy.flatnonzero(phases == phase)
+        _, first = numpy.unique(keys[in_phase], return_index=True)
+        chosen = in_phase[first]
+        keep = numpy.ones(len(chosen), dtype=numpy.bool_)
+        if len(accepted_keys):
+            index = numpy.searchsorted(accepted_keys, keys[chosen])
+            index = numpy.minimum(index, len(accepted_keys) - 1)
+            chosen = chosen[accepted_keys[index] != keys[chosen]]
+            keep = keep[:len(chosen)]
+            for start in range(0, len(chosen), block_size):
+                block = chosen[start:start + block_size]
+                neighbours = keys[block][:, numpy.newaxis] + offsets
+                index = numpy.searchsorted(accepted_keys, neighbours)
+                index = numpy.minimum(index, len(accepted_keys) - 1)
+                rows, columns = numpy.nonzero(accepted_keys[index] ==
+                                              neighbours)
+                others = accepted[index[rows, columns]]
+                distances = numpy.sum((others - candidates[block[rows]]) ** 2,
+                                      axis=1)
+                conflicts = numpy.bincount(
+                    rows[distances < min_distance ** 2],
+                    minlength=len(block))
+                keep[start:start + block_size] = conflicts == 0
+        new = chosen[keep]
+        accepted = numpy.concatenate((accepted, candidates[new]))
+        accepted_keys = numpy.concatenate((accepted_keys, keys[new]))
+        order = numpy.argsort(accepted_keys, kind='mergesort')
+        accepted = accepted[order]
+        accepted_keys = accepted_keys[order]
+
+    return accepted
+
+
+def sample_poisson(verts, triangles, amount, random_state,
+                   min_distance=0.0, alias_table=None, max_rounds=8):
+    """
+    sample_poisson(numpy array verts, numpy array triangles, int amount,
+                   CounterRandom random_state, float min_distance,
+                   tuple alias_table, int max_rounds) -> numpy array points
+
+        Draws up to <amount> blue noise points on the triangles: no two
+        points are closer than min_distance. Candidates are drawn on the
+        surface in rounds and thinned with thin_poisson, until there are
+        enough points or max_rounds is reached. If min_distance is 0.0 it
+        is derived from the area and the amount.
+
+        numpy array verts          - (V, 3) array of vertex coordinates (the
+                                     distances are measured in this space)
+        numpy array triangles      - (T, 3) array of vertex indices
+        int amount                 - the amount of points to return
+        CounterRandom random_state - the random generator to use
+        float min_distance         - the minimum distance between the points
+        tuple alias_table          - the (prebuilt) weighted sampling index
+        int max_rounds             - the maximum number of candidate rounds
+    """
+
+    areas = get_triangle_areas(verts, triangles)
+    if not amount or not len(areas) or areas.sum() <= 0.0:
+        return numpy.zeros((0, 3))
+    if min_distance <= 0.0:
+        # Random close packing of the discs covers roughly half the area
+        min_distance = math.sqrt(0.5 * areas.sum() / amount)
+
+    origin = verts.min(axis=0)
+    points = numpy.zeros((0, 3))
+    for _ in range(max_rounds):
+        candidates = sample_surface(verts, triangles, 2 * amount,
+                                    random_state, areas=areas,
+                                    alias_table=alias_table)
+        points = thin_poisson(candidates, min_distance, random_state,
+                              accepted=points, origin=origin)
+        if len(points) >= amount:
+            break
+    if len(points) > amount:
+        points = points[random_state.permutation(len(points))[:amount]]
+
+    return points
+
+
+def get_random_points_poisson(verts, triangles, amount, transform_matrix,
+                              seed=0, min_distance=0.0, alias_table=None):
+    """
+    get_random_points_poisson(numpy array verts, numpy array triangles,
+                              int amount, matrix transform_matrix, int seed,
+                              float min_distance, tuple alias_table)
             -> list of vector points
 
-        Gets <amount> number of random points on the surface of the object.
+        Gets up to <amount> number of evenly spread (blue noise) points on
+        the surface of the mesh. The minimum distance is measured in world
+        space.
 
-        object obj              - the object to get the points from
+        numpy array verts       - (V, 3) array with the vertex coordinates
+        numpy array triangles   - (T, 3) array with the vertex indices
         int amount              - the amount of points to return
+        matrix transform_matrix - the matrix to transform the points by
         int seed                - the seed for the randomization
+        float min_distance      - the minimum distance (0.0 is automatic)
+        tuple alias_table       - the (prebuilt) weighted sampling index
     """
 
-    m = obj.modifiers.new('points', 'PARTICLE_SYSTEM')
-    ps = m.particle_system
-    ps.seed = seed
-    ps.settings.count = amount
-    ps.settings.frame_start = 1
-    ps.settings.frame_end = 1
-    ps.settings.emit_from = 'FACE'
-    ps.settings.physics_type = 'NO'
-    ps.settings.use_modifier_stack = True
-    bpy.context.scene.update()
-    points = [p.location.copy() for p in ps.particles]
-    obj.modifiers.remove(m)
+    random_state = get_random_state(seed)
+    verts = transform_points(verts, transform_matrix)
+    points = sample_poisson(verts, triangles, amount, random_state,
+                            min_distance=min_distance,
+                            alias_table=alias_table)
+    if len(points) < amount:
+        print("Only {} of {} points fit with the minimum "
+              "distance...".format(len(points), amount))
 
-    return points
+    return [Vector(p) for p in points]
+
+
+def get_random_points_on_surface(verts, triangles, amount, transform_matrix,
+                                 seed=0, areas=None, alias_table=None):
+    """
+    get_random_points_on_surface(numpy array verts, numpy array triangles,
+                                 int amount, matrix transform_matrix,
+                                 int seed, numpy array areas,
+                                 tuple alias_table)
+            -> list of vector points
+
+        Gets <amount> number of random points on the surface of the mesh.
+        The points are evenly distributed over the area of the mesh, or
+        weighted by the alias table if it is given.
+
+        numpy array verts       - (V, 3) array with the vertex coordinates
+        numpy array triangles   - (T, 3) array with the vertex indices
+        int amount              - the amount of points to return
+        matrix transform_matrix - the matrix to transform the points by
+        int seed                - the seed for the randomization
+        numpy array areas       - the (precalculated) triangle areas
+        tuple alias_table       - the (prebuilt) weighted sampling index
+    """
+
+    random_state = get_random_state(seed)
+    points = sample_surface(verts, triangles, amount, random_state,
+                            areas=areas, alias_table=alias_table)
+    points = transform_points(points, transform_matrix)
+
+    return [Vector(p) for p in points]
 
 
 # def get_random_points_in_volume(obj, amount):
@@ -175,32 +1051,237 @@ def get_random_points_on_surface(obj, amount, seed=0):
 #     return points
 
 
-def get_random_points_in_volume(obj, amount, seed=0):
+def create_bvh_tree(verts, triangles):
+    """
+    create_bvh_tree(numpy array verts, numpy array triangles) -> BVHTree tree
+
+        Builds a BVH tree of the triangles (in the space of the vertices).
+    """
+
+    return BVHTree.FromPolygons(verts.tolist(), triangles.tolist())
+
+
+def sample_volume(verts, triangles, amount, random_state,
+                  tree=None, max_candidates=None, block_size=1024):
+    """
+    sample_volume(numpy array verts, numpy array triangles, int amount,
+                  CounterRandom random_state, BVHTree tree,
+                  int max_candidates, int block_size)
+            -> tuple (numpy array points, float acceptance_rate)
+
+        Draws <amount> uniformly distributed points inside the (closed) mesh.
+        Candidates are generated in blocks in the bounding box and are kept
+        if the closest point on the mesh faces away from them. The block
+        size follows the acceptance rate so far. Gives up after
+        max_candidates candidates (by default 1000 per point), so thin or
+        open meshes return less points instead of stalling.
+
+        numpy array verts          - (V, 3) array of vertex coordinates
+        numpy array triangles      - (T, 3) array of vertex indices
+        int amount                 - the amount of points to return
+        CounterRandom random_state - the random generator to use
+        BVHTree tree               - the (prebuilt) tree of the triangles
+        int max_candidates         - the maximum number of candidates to test
+        int block_size             - the minimum number of candidates per block
+    """
+
+    if not len(triangles) or not amount:
+        return numpy.zeros((0, 3)), 0.0
+    if tree is None:
+        tree = create_bvh_tree(verts, triangles)
+    if max_candidates is None:
+        max_candidates = amount * 1000
+
+    low = verts.min(axis=0)
+    high = verts.max(axis=0)
+    accepted = []
+    accepted_count = 0
+    tested = 0
+    while accepted_count < amount and tested < max_candidates:
+        rate = (accepted_count + 1.0) / (tested + 1.0)
+        block = int((amount - accepted_count) / rate * 1.2)
+        block = min(max(block, block_size), max_candidates - tested)
+        candidates = low + random_state.random_sample((block, 3)) * (high -
+                                                                     low)
+        inside = numpy.zeros(block, dtype=numpy.bool_)
+        for i, p in enumerate(candidates.tolist()):
+            location, normal, _, _ = tree.find_nearest(p)
+            if location is None:
+                continue
+            inside[i] = ((location[0] - p[0]) * normal[0] +
+                         (location[1] - p[1]) * normal[1] +
+                         (location[2] - p[2]) * normal[2]) > 0.0
+        tested += block
+        candidates = candidates[inside]
+        accepted.append(candidates)
+        accepted_count += len(candidates)
+
+    points = numpy.concatenate(accepted)[:amount]
+    acceptance_rate = accepted_count / tested if tested else 0.0
+
+    return points, acceptance_rate
+
+
+def get_random_points_in_volume(verts, triangles, amount, transform_matrix,
+                                seed=0, tree=None):
     """
-    get_random_points_in_volume(object obj, int amount, int seed)
+    get_random_points_in_volume(numpy array verts, numpy array triangles,
+                                int amount, matrix transform_matrix,
+                                int seed, BVHTree tree)
             -> list of vector points
 
-        Gets <amount> number of random points inside the volume of the object.
+        Gets <amount> number of random points inside the volume of the mesh.
+        Prints the acceptance rate if less points than requested were found.
 
-        object obj              - the object to get the points from
+        numpy array verts       - (V, 3) array with the vertex coordinates
+        numpy array triangles   - (T, 3) array with the vertex indices
         int amount              - the amount of points to return
+        matrix transform_matrix - the matrix to transform the points by
         int seed                - the seed for the randomization
+        BVHTree tree            - the (prebuilt) tree of the triangles
     """
 
-    m = obj.modifiers.new('points', 'PARTICLE_SYSTEM')
-    ps = m.particle_system
-    ps.seed = seed
-    ps.settings.count = amount
-    ps.settings.frame_start = 1
-    ps.settings.frame_end = 1
-    ps.settings.emit_from = 'VOLUME'
-    ps.settings.physics_type = 'NO'
-    ps.settings.use_modifier_stack = True
-    bpy.context.scene.update()
-    points = [p.location.copy() for p in ps.particles]
-    obj.modifiers.remove(m)
+    random_state = get_random_state(seed)
+    points, acceptance_rate = sample_volume(verts, triangles,
+                                            amount, random_state, tree=tree)
+    if len(points) < amount:
+        print("Max attempts reached, got {} points less then specified "
+              "(acceptance rate {:.2%})...".format(amount - len(points),
+                                                  acceptance_rate))
+    points = transform_points(points, transform_matrix)
 
-    return points
+    return [Vector(p) for p in points]
+
+
+def get_colliders(objects, apply_modifiers=True):
+    """
+    get_colliders(list of object objects, bool apply_modifiers)
+            -> list of dict colliders
+
+        Gathers the (cached) BVH trees of the objects for find_collisions,
+        with their names, world matrices and world space bounds. Objects
+        without faces are skipped. This has to run on the main thread.
+    """
+
+    colliders = []
+    for obj in objects:
+        if obj.type != 'MESH':
+            continue
+        mesh_data = get_mesh_data(obj, apply_modifiers=apply_modifiers)
+        if not len(mesh_data["triangles"]):
+            continue
+        matrix = numpy.array(obj.matrix_world, dtype=numpy.float64)
+        verts = transform_points(mesh_data["verts"], matrix)
+        colliders.append({"name": obj.name,
+                          "tree": get_bvh_tree(mesh_data),
+                          "inverse": numpy.linalg.inv(matrix),
+                          "bounds": (verts.min(axis=0), verts.max(axis=0))})
+
+    return colliders
+
+
+def find_collisions(colliders, points, counts, margin=0.01, ignored=None):
+    """
+    find_collisions(list of dict colliders, numpy array points,
+                    numpy array counts, float margin, numpy array ignored)
+            -> numpy array colliding
+
+        Tests which of the polylines (the (M, 3) world space points, <counts>
+        per line, see curve_tools.tessellate_splines) pass through the
+        colliders (see get_colliders). The segments are culled by the
+        bounds of every collider and moved to its space with arrays, only
+        the remaining segments are ray cast against its tree. Lines that
+        start or end on a surface also collide when they leave it to the
+        inside (a line between two points of a convex object doesn't cross
+        its surface). Returns an (N,) bool array with the colliding lines.
+
+        float margin        - the part of the first and last segment of
+                              every line that isn't ray cast, so lines can
+                              start and end on the surfaces
+        numpy array ignored - (N, 2) array with the indices of the colliders
+                              every line isn't tested against (-1 for none),
+                              the objects lines start and end inside of for
+                              example
+    """
+
+    counts = numpy.asarray(counts, dtype=numpy.int64)
+    colliding = numpy.zeros(len(counts), dtype=numpy.bool_)
+    if not colliders or not len(points):
+        return colliding
+
+    # The segments of all lines (every point but the last of a line starts
+    # a segment)
+    ends = numpy.cumsum(counts)
+    starts = ends - counts
+    segment_counts = numpy.maximum(counts - 1, 0)
+    lines = numpy.repeat(numpy.arange(len(counts)), segment_counts)
+    indices = (numpy.arange(len(lines)) +
+               numpy.repeat(starts - (numpy.cumsum(segment_counts) -
+                                      segment_counts), segment_counts))
+    heads = points[indices].astype(numpy.float64)
+    tails = points[indices + 1].astype(numpy.float64)
+    # Leave out the ends of the lines
+    is_first = indices == starts[lines]
+    is_last = indices + 2 == ends[lines]
+    vectors = tails - heads
+    # The ends of the lines, and the direction in which they leave them
+    anchors = numpy.concatenate((heads[is_first], tails[is_last]))
+    leaving = numpy.concatenate((vectors[is_first], -vectors[is_last]))
+    anchor_lines = numpy.concatenate((lines[is_first], lines[is_last]))
+    heads[is_first] += vectors[is_first] * margin
+    tails[is_last] -= vectors[is_last] * margin
+
+    for index, collider in enumerate(colliders):
+        low, high = collider["bounds"]
+        inverse = collider["inverse"]
+        tree = collider["tree"]
+        if ignored is None:
+            tested = ~colliding
+        else:
+            tested = ~colliding & (ignored != index).all(axis=1)
+        # Ends on the surface that leave it to the inside
+        candidates = numpy.flatnonzero((anchors <= high).all(axis=1) &
+                                       (anchors >= low).all(axis=1) &
+                                       tested[anchor_lines])
+        if len(candidates):
+            origins = transform_points(anchors[candidates], inverse)
+            directions = transform_points(anchors[candidates] +
+                                          leaving[candidates],
+                                          inverse) - origins
+            reach = numpy.sqrt((directions ** 2).sum(axis=1)) * margin
+            for line, origin, direction, distance in zip(
+                    anchor_lines[candidates].tolist(), origins.tolist(),
+                    directions.tolist(), reach.tolist()):
+                if colliding[line]:
+                    continue
+                location, normal, _, _ = tree.find_nearest(origin, distance)
+                if location is not None and (direction[0] * normal[0] +
+                                             direction[1] * normal[1] +
+                                             direction[2] * normal[2]) < 0:
+                    colliding[line] = True
+
+        # Segments that cross the surface
+        candidates = ((numpy.minimum(heads, tails) <= high).all(axis=1) &
+                      (numpy.maximum(heads, tails) >= low).all(axis=1) &
+                      tested[lines])
+        candidates = numpy.flatnonzero(candidates)
+        if not len(candidates):
+            continue
+        origins = transform_points(heads[candidates], inverse)
+        directions = transform_points(tails[candidates], inverse) - origins
+        distances = numpy.sqrt((directions ** 2).sum(axis=1))
+        valid = distances > 0
+        directions[valid] /= distances[valid][:, None]
+        for line, origin, direction, distance in zip(
+                lines[candidates].tolist(), origins.tolist(),
+                directions.tolist(), distances.tolist()):
+            if colliding[line] or not distance:
+                continue
+            location, _, _, _ = tree.ray_cast(origin, direction, distance)
+            if location is not None:
+                colliding[line] = True
+
+    return colliding
 
 
 # def get_point_on_edge(edge, transform_matrix, method='RANDOM'):
@@ -235,7 +1316,109 @@ def get_random_points_in_volume(obj, amount, seed=0):
 #         return transform_matrix * v.co
 
 
-def get_points(obj, amount=1, method='SURFACE', apply_modifiers=True, seed=0):
+def prepare_points(obj, method='SURFACE', apply_modifiers=True,
+                   density=None, min_distance=0.0, density_signature=None):
+    """
+    prepare_points(object obj, string method, bool apply_modifiers,
+                   tuple density, float min_distance,
+                   int density_signature) -> dict job
+
+        Gathers everything sample_points needs from Blender: the (cached)
+        geometry arrays, sampling index, BVH tree and world matrix of the
+        object. This has to run on the main thread, sample_points only does
+        numpy math and can run on any thread. Returns nothing if the method
+        isn't valid. See get_points for the arguments.
+    """
+
+    valid_methods = {'VERTS', 'EDGES', 'SURFACE', 'VOLUME', 'POISSON',
+                     'PIVOT'}
+
+    if not method in valid_methods:
+        return
+
+    job = {"method": method,
+           "matrix": numpy.array(obj.matrix_world, dtype=numpy.float64),
+           "min_distance": min_distance}
+    if method == 'PIVOT':
+        return job
+
+    if method not in {'SURFACE', 'POISSON'}:
+        density = None
+    mesh_data = get_mesh_data(obj, apply_modifiers=apply_modifiers,
+                              density=density,
+                              density_signature=density_signature)
+    for key in ("verts", "edges", "edge_lengths", "triangles"):
+        job[key] = mesh_data[key]
+    if method in {'SURFACE', 'POISSON'}:
+        job["alias_table"] = get_surface_alias_table(mesh_data,
+                                                     density=density)
+    if method == 'VOLUME' and len(mesh_data["triangles"]):
+        job["tree"] = get_bvh_tree(mesh_data)
+
+    return job
+
+
+def sample_points(job, amount, random_state):
+    """
+    sample_points(dict job, int amount, CounterRandom random_state)
+            -> numpy array points
+
+        Draws the points of a job (see prepare_points) and returns them as
+        an (N, 3) array in world space.
+    """
+
+    method = job["method"]
+    matrix = job["matrix"]
+    if method == 'PIVOT':
+        # Only return the pivot point
+        return matrix[numpy.newaxis, :3, 3].copy()
+
+    verts = job["verts"]
+    empty = numpy.zeros((0, 3))
+    if not len(verts):
+        return empty
+
+    if method == 'VERTS':
+        points = sample_verts(verts, amount, random_state)
+    elif method == 'EDGES':
+        if not len(job["edges"]):
+            return empty
+        points = sample_edges(verts, job["edges"], amount, random_state,
+                              lengths=job["edge_lengths"])
+    elif method == 'SURFACE':
+        if job["alias_table"] is None:
+            return empty
+        points = sample_surface(verts, job["triangles"], amount,
+                                random_state,
+                                alias_table=job["alias_table"])
+    elif method == 'POISSON':
+        if job["alias_table"] is None:
+            return empty
+        # The distances are measured in world space
+        points = sample_poisson(transform_points(verts, matrix),
+                                job["triangles"], amount, random_state,
+                                min_distance=job["min_distance"],
+                                alias_table=job["alias_table"])
+        if len(points) < amount:
+            print("Only {} of {} points fit with the minimum "
+                  "distance...".format(len(points), amount))
+        return points
+    elif method == 'VOLUME':
+        if "tree" not in job:
+            return empty
+        points, acceptance_rate = sample_volume(verts, job["triangles"],
+                                                amount, random_state,
+                                                tree=job["tree"])
+        if len(points) < amount:
+            print("Max attempts reached, got {} points less then specified "
+                  "(acceptance rate {:.2%})...".format(amount - len(points),
+                                                      acceptance_rate))
+
+    return transform_points(points, matrix)
+
+
+def get_points(obj, amount=1, method='SURFACE', apply_modifiers=True, seed=0,
+               density=None, min_distance=0.0):
     """
     get_points(object obj,
                int amount,
@@ -253,41 +1436,75 @@ def get_points(obj, amount=1, method='SURFACE', apply_modifiers=True, seed=0):
                                               - 'EDGES'
                                               - 'SURFACE'
                                               - 'VOLUME'
+                                              - 'POISSON'
                                               - 'PIVOT'
         bool apply_modifiers - use the deformed or original mesh
         int seed             - the seed for the randomization
+        tuple density        - (source, name) to weight the 'SURFACE' and
+                               'POISSON' points by, source is 'VERTEX_GROUP'
+                               or 'ATTRIBUTE' (a float face layer)
+        float min_distance   - the minimum distance between 'POISSON'
+                               points (0.0 derives it from the amount)
     """
 
-    valid_methods = {'VERTS', 'EDGES', 'SURFACE', 'VOLUME', 'PIVOT'}
-
-    if not method in valid_methods:
+    job = prepare_points(obj, method=method,
+                         apply_modifiers=apply_modifiers,
+                         density=density,
+                         min_distance=min_distance)
+    if job is None:
         return
+    points = sample_points(job, amount, get_random_state(seed))
 
-    if apply_modifiers and not method == 'PIVOT':
-        mesh = obj.to_mesh(bpy.context.scene, True, 'PREVIEW')
-    elif method != 'PIVOT':
-        mesh = obj.data.copy()
-    transform_matrix = obj.matrix_world.copy()
+    return [Vector(p) for p in points]
 
-    if method == 'VERTS':
-        return get_random_points_on_verts(mesh, amount,
-                                          transform_matrix, seed=seed)
-        # points.append(transform_matrix * random.choice(mesh.vertices).co)
-    if method == 'EDGES':
-        return get_random_points_on_edges(mesh, amount,
-                                          transform_matrix, seed=seed)
-        # edge = random.choice(mesh.edges)
-        # points.append(get_point_on_edge(edge, transform_matrix))
-    if method == 'SURFACE':
-        return get_random_points_on_surface(obj, amount, seed=seed)
-        # face = random.choice(mesh.tessfaces)
-        # point = bpy_extras.mesh_utils.face_random_points(1, [face])[0]
-        # points.append(transform_matrix * point)
-    if method == 'VOLUME':
-        return get_random_points_in_volume(obj, amount, seed=seed)
-    if method == 'PIVOT':
-        # Only return the pivot point
-        return [transform_matrix.to_translation()]
+
+def get_points_batch(objects, amounts, method='SURFACE', apply_modifiers=True,
+                     seed=0, density=None, min_distance=0.0, threads=0,
+                     density_signatures=None):
+    """
+    get_points_batch(list of object objects, list of int amounts,
+                     string method, bool apply_modifiers, int seed,
+                     tuple density, float min_distance, int threads,
+                     list of int density_signatures)
+            -> list of numpy array points
+
+        Calculates the points of many objects at once (see get_points),
+        returns an (N, 3) array of world space points per object. The data
+        is gathered from Blender on the calling thread, the sampling itself
+        is spread over a pool of threads. Every object gets its own random
+        stream (from the seed and its position in the list), so the result
+        doesn't depend on the number of threads.
+
+        list of int amounts            - the amount of points per object
+        int threads                    - the number of threads (0 is one
+                                         per cpu, 1 samples on the calling
+                                         thread)
+        list of int density_signatures - the signature of the density
+                                         weights per object, so they are
+                                         not read again (see
+                                         get_density_signature)
+    """
+
+    if density_signatures is None:
+        density_signatures = [None] * len(objects)
+    jobs = [prepare_points(obj, method=method,
+                           apply_modifiers=apply_modifiers,
+                           density=density,
+                           min_distance=min_distance,
+                           density_signature=density_signature)
+            for obj, density_signature in zip(objects, density_signatures)]
+    if any(job is None for job in jobs):
+        return
+    random_states = [get_random_state(seed, i) for i in range(len(jobs))]
+
+    if not threads:
+        threads = os.cpu_count() or 1
+    threads = min(threads, len(jobs))
+    if threads < 2:
+        return list(map(sample_points, jobs, amounts, random_states))
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        return list(executor.map(sample_points, jobs, amounts,
+                                 random_states))
 
 
 # obj = bpy.data.objects['Suzanne']
@@ -0,0 +1,180 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+
+import numpy
+
+
+# The stages of a web get their own streams, so changing one stage doesn't
+# change the random numbers of the others
+STREAM_OBJECTS = 1
+STREAM_PAIRS = 2
+STREAM_DRAPES = 3
+STREAM_SUB_STRANDS = 4
+
+GOLDEN_GAMMA = numpy.uint64(0x9E3779B97F4A7C15)
+MASK = 2 ** 64 - 1
+
+
+def mix(values):
+    """
+    mix(numpy array values) -> numpy array values
+
+        Scrambles an array of uint64 values with the finalizer of
+        splitmix64 (wrapping around on overflow).
+    """
+
+    values = numpy.array(values, dtype=numpy.uint64)
+    values ^= values >> numpy.uint64(30)
+    values *= numpy.uint64(0xBF58476D1CE4E5B9)
+    values ^= values >> numpy.uint64(27)
+    values *= numpy.uint64(0x94D049BB133111EB)
+    values ^= values >> numpy.uint64(31)
+
+    return values
+
+
+def get_key(*values):
+    """
+    get_key(int *values) -> int key
+
+        Returns a 64 bit key for a seed and stream numbers (an object index,
+        an iteration, ...). Different values give unrelated keys.
+    """
+
+    key = numpy.uint64(0)
+    for value in values:
+        key = mix(key ^ numpy.uint64(int(value) & MASK)) + GOLDEN_GAMMA
+
+    return int(key)
+
+
+def get_bits(key, counters):
+    """
+    get_bits(int key, numpy array counters) -> numpy array bits
+
+        Returns the random uint64 numbers of the counters for the key, the
+        numbers of splitmix64 started at the key. Every number only
+        depends on the key and its counter.
+    """
+
+    counters = numpy.asarray(counters, dtype=numpy.uint64)
+
+    return mix(numpy.uint64(key) + (counters + numpy.uint64(1)) *
+               GOLDEN_GAMMA)
+
+
+def get_floats(key, counters):
+    """
+    get_floats(int key, numpy array counters) -> numpy array floats
+
+        Returns uniformly distributed floats in [0, 1) for the counters (from
+        the upper 53 bits of get_bits).
+    """
+
+    bits = get_bits(key, counters) >> numpy.uint64(11)
+
+    return bits.astype(numpy.float64) * (1.0 / 2 ** 53)
+
+
+class CounterRandom:
+    """
+    CounterRandom(int *values)
+
+        A counter based random generator with the methods of numpy's
+        RandomState used by the add-on. Every number is a hash of the key
+        (see get_key) and a counter, so it doesn't depend on how many
+        numbers were drawn before, or on which thread. Draws use the next
+        counters, or the counters given to at().
+    """
+
+    def __init__(self, *values):
+        self.key = get_key(*values)
+        self.counter = 0
+        self.counters = None
+
+    def stream(self, *values):
+        """
+        stream(int *values) -> CounterRandom random_state
+
+            Returns an independent generator, keyed by this key and the
+            values.
+        """
+
+        return CounterRandom(self.key, *values)
+
+    def at(self, counters):
+        """
+        at(int or numpy array counters) -> CounterRandom random_state
+
+            Returns a generator with the same key that starts at a counter,
+            or that draws the numbers of an (N,) array of counters (with
+            every draw of N numbers).
+        """
+
+        random_state = CounterRandom()
+        random_state.key = self.key
+        if numpy.ndim(counters):
+            random_state.counters = numpy.asarray(counters)
+        else:
+            random_state.counter = int(counters)
+
+        return random_state
+
+    def get_counters(self, count):
+        if self.counters is not None:
+            if count != len(self.counters):
+                raise ValueError("Expected {} numbers, not {}".format(
+                    len(self.counters), count))
+            return self.counters
+        counters = numpy.arange(self.counter, self.counter + count,
+                                dtype=numpy.uint64)
+        self.counter += count
+
+        return counters
+
+    def random_sample(self, size=None):
+        shape = () if size is None else numpy.atleast_1d(size)
+        floats = get_floats(self.key,
+                            self.get_counters(int(numpy.prod(shape))))
+        if size is None:
+            return float(floats[0])
+
+        return floats.reshape(tuple(shape))
+
+    def uniform(self, low=0.0, high=1.0, size=None):
+        return low + self.random_sample(size) * (high - low)
+
+    def randint(self, low, high=None, size=None):
+        if high is None:
+            low, high = 0, low
+        values = numpy.floor(self.uniform(low, high, size))
+
+        return numpy.minimum(values, high - 1).astype(numpy.int64)
+
+    def triangular(self, left, mode, right, size=None):
+        floats = self.random_sample(size)
+        split = (mode - left) / (right - left)
+        lower = left + numpy.sqrt(floats * (right - left) * (mode - left))
+        upper = right - numpy.sqrt((1 - floats) * (right - left) *
+                                   (right - mode))
+
+        return numpy.where(floats < split, lower, upper)
+
+    def permutation(self, count):
+        return numpy.argsort(self.random_sample(count), kind='mergesort')
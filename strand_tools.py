@@ -0,0 +1,841 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+
+import math
+import numpy
+from mathutils.kdtree import KDTree
+from . import curve_tools
+from . import random_tools
+
+
+class StrandBuffer:
+    """
+    StrandBuffer(int point_count, int capacity)
+
+        The strands of a web in contiguous arrays, which grow (by doubling)
+        when strands are appended. Every strand has:
+
+        control_points - (P, 3) array with its control points
+        drapes         - the largest offset of its points by the drape
+        keys           - the counter of its random drape (see
+                         get_strand_keys)
+        anchor_ids     - the indices of the two points a main strand hangs
+                         from (-1 for sub strands)
+        parameters     - the positions on the parents a sub strand hangs
+                         from (0 for main strands)
+        parent_ids     - the ids of the two strands a sub strand hangs from
+                         (-1 for main strands)
+        source_ids     - the ids of the two objects a main strand hangs from
+                         (-1 for sub strands)
+
+        The arrays are attributes with the name of the field, which are views
+        on the used part of the arrays. The ids of the strands are their
+        indices. Everything but the control points and drapes is the
+        topology of the web, from which drape_strands can recreate the
+        control points.
+    """
+
+    # The name, shape (after the strand axis, None for the control points),
+    # type and initial value of the fields
+    fields = (("control_points", None, numpy.float32, 0),
+              ("drapes", (), numpy.float32, 0),
+              ("keys", (), numpy.int64, -1),
+              ("anchor_ids", (2,), numpy.int32, -1),
+              ("parameters", (2,), numpy.float32, 0),
+              ("parent_ids", (2,), numpy.int32, -1),
+              ("source_ids", (2,), numpy.int32, -1))
+
+    def __init__(self, point_count=3, capacity=0):
+        self.point_count = point_count
+        self.count = 0
+        self.arrays = {}
+        for name, shape, dtype, value in self.fields:
+            if shape is None:
+                shape = (point_count, 3)
+            self.arrays[name] = numpy.full((capacity,) + shape, value,
+                                           dtype=dtype)
+
+    def __len__(self):
+        return self.count
+
+    def __getattr__(self, name):
+        arrays = self.__dict__.get("arrays", {})
+        if name in arrays:
+            return arrays[name][:self.count]
+        raise AttributeError(name)
+
+    @property
+    def capacity(self):
+        return len(self.arrays["drapes"])
+
+    @property
+    def strand_size(self):
+        """The number of bytes per strand"""
+        return sum(array.itemsize * int(numpy.prod(array.shape[1:]))
+                   for array in self.arrays.values())
+
+    @property
+    def nbytes(self):
+        """The number of bytes used by the strands"""
+        return self.count * self.strand_size
+
+    def reserve(self, capacity):
+        """
+        reserve(int capacity)
+
+            Makes room for at least <capacity> strands.
+        """
+
+        if capacity <= self.capacity:
+            return
+        for name, _, _, value in self.fields:
+            old = self.arrays[name]
+            new = numpy.empty((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:len(old)] = old
+            new[len(old):] = value
+            self.arrays[name] = new
+
+    def append(self, control_points, **fields):
+        """
+        append(numpy array control_points, numpy array **fields) -> range ids
+
+            Adds the (N, P, 3) control points, and optionally the arrays of
+            the other fields (by name), to the buffer. Returns the ids of the
+            new strands.
+        """
+
+        start = self.count
+        end = start + len(control_points)
+        if end > self.capacity:
+            self.reserve(max(end, 2 * self.capacity))
+        self.arrays["control_points"][start:end] = control_points
+        for name, values in fields.items():
+            if values is not None:
+                self.arrays[name][start:end] = values
+        self.count = end
+
+        return range(start, end)
+
+
+def get_strand_keys(iteration, attempt, positions):
+    """
+    get_strand_keys(int iteration, int attempt, numpy array positions)
+            -> numpy array keys
+
+        Returns the counters of the random drapes of the strands at the
+        positions of an iteration of sub strands (-1 for main strands) and
+        an attempt, unique within a web.
+    """
+
+    return ((iteration + 1) * 2 ** 40 + attempt * 2 ** 32 +
+            numpy.asarray(positions, dtype=numpy.int64))
+
+
+def pair_indices(count, iterations, random_state, max_pairs=None):
+    """
+    pair_indices(int count, int iterations, CounterRandom random_state,
+                 int max_pairs)
+            -> (numpy array start_indices, numpy array end_indices)
+
+        Pairs every index in range(count) with a random other index,
+        <iterations> times. The partner is the start index plus a random
+        offset in [1, count), wrapped around, so an index is never paired
+        with itself and no rejection loop is needed.
+
+        int count                  - the number of points to pair
+        int iterations             - how many partners every point gets
+        CounterRandom random_state - the random generator to use
+        int max_pairs              - only create the first <max_pairs> pairs
+                                     (None is no maximum)
+    """
+
+    if count < 2 or iterations < 1:
+        empty = numpy.zeros(0, dtype=numpy.int64)
+        return empty, empty
+    pair_count = count * iterations
+    if max_pairs is not None:
+        pair_count = min(pair_count, max_pairs)
+    start_indices = numpy.arange(pair_count, dtype=numpy.int64) % count
+    offsets = random_state.randint(1, count, len(start_indices))
+    end_indices = (start_indices + offsets) % count
+
+    return start_indices, end_indices
+
+
+def create_kd_tree(points):
+    """
+    create_kd_tree(numpy array points) -> KDTree tree
+
+        Returns a balanced kd-tree of the (N, 3) points, with the index of
+        every point as its index.
+    """
+
+    tree = KDTree(len(points))
+    for index, point in enumerate(points.tolist()):
+        tree.insert(point, index)
+    tree.balance()
+
+    return tree
+
+
+def query_kd_tree(tree, points, k):
+    """
+    query_kd_tree(KDTree tree, numpy array points, int k)
+            -> (numpy array neighbours, numpy array distances)
+
+        Returns the (N, k) indices and distances of the k nearest points in
+        the tree of every one of the (N, 3) points (nearest first, -1 and
+        inf where the tree has less than k points).
+    """
+
+    neighbours = numpy.full((len(points), k), -1, dtype=numpy.int64)
+    distances = numpy.full((len(points), k), numpy.inf)
+    results = [tree.find_n(point, k) for point in points.tolist()]
+    counts = numpy.array([len(result) for result in results],
+                         dtype=numpy.int64)
+    if not counts.sum():
+        return neighbours, distances
+    rows = numpy.repeat(numpy.arange(len(points)), counts)
+    columns = numpy.arange(len(rows)) - numpy.repeat(numpy.cumsum(counts) -
+                                                     counts, counts)
+    neighbours[rows, columns] = [index for result in results
+                                 for _, index, _ in result]
+    distances[rows, columns] = [distance for result in results
+                                for _, _, distance in result]
+
+    return neighbours, distances
+
+
+def query_other_objects(points, object_indices, queries, k):
+    """
+    query_other_objects(numpy array points, numpy array object_indices,
+                        numpy array queries, int k)
+            -> (numpy array neighbours, numpy array distances)
+
+        Returns the (Q, k) indices and distances of the k nearest points on
+        other objects of the points with the given indices (nearest first,
+        -1 and inf where there are less than k). The objects are split in
+        halves, and those in halves again, and so on. Every point asks the
+        kd-tree of the half next to its own object on every level, so it
+        asks log2(objects) trees for k points, however many of its nearest
+        points are on its own object.
+
+        numpy array object_indices - (N,) array with the object of every
+                                     point, numbered from 0
+        numpy array queries        - (Q,) array with the indices of the
+                                     points to find the neighbours of
+    """
+
+    neighbours = [numpy.full((len(queries), k), -1, dtype=numpy.int64)]
+    distances = [numpy.full((len(queries), k), numpy.inf)]
+    query_objects = object_indices[queries]
+    for level in range(int(object_indices.max()).bit_length()):
+        groups = object_indices >> level
+        order = numpy.argsort(groups, kind='mergesort')
+        sorted_groups = groups[order]
+        # The other half of the group of the object one level up
+        siblings = (query_objects >> level) ^ 1
+        query_order = numpy.argsort(siblings, kind='mergesort')
+        sorted_siblings = siblings[query_order]
+        level_neighbours = numpy.full((len(queries), k), -1,
+                                      dtype=numpy.int64)
+        level_distances = numpy.full((len(queries), k), numpy.inf)
+        for sibling in numpy.unique(siblings).tolist():
+            members = order[numpy.searchsorted(sorted_groups, sibling):
+                            numpy.searchsorted(sorted_groups, sibling,
+                                               side='right')]
+            if not len(members):
+                continue
+            rows = query_order[numpy.searchsorted(sorted_siblings, sibling):
+                               numpy.searchsorted(sorted_siblings, sibling,
+                                                  side='right')]
+            tree = create_kd_tree(points[members])
+            found, lengths = query_kd_tree(tree, points[queries[rows]], k)
+            level_neighbours[rows] = numpy.where(found >= 0, members[found],
+                                                 -1)
+            level_distances[rows] = lengths
+        neighbours.append(level_neighbours)
+        distances.append(level_distances)
+
+    # The k nearest of all levels
+    neighbours = numpy.concatenate(neighbours, axis=1)
+    distances = numpy.concatenate(distances, axis=1)
+    nearest = numpy.argsort(distances, axis=1, kind='mergesort')[:, :k]
+    rows = numpy.arange(len(queries))[:, numpy.newaxis]
+
+    return neighbours[rows, nearest], distances[rows, nearest]
+
+
+def find_nearest(points, k, object_ids=None, max_length=0.0):
+    """
+    find_nearest(numpy array points, int k, numpy array object_ids,
+                 float max_length)
+            -> (numpy array neighbours, numpy array distances)
+
+        Finds the k nearest other points of every one of the (N, 3) points.
+        First every point asks one kd-tree of all points for its k + 1
+        nearest points. The points which don't get k points on other
+        objects that way (mostly because their own object is nearer) are
+        looked up in trees of the other objects only (see
+        query_other_objects). Returns the (N, k) indices of the neighbours
+        (nearest first, -1 where there are less than k) and their distances
+        (inf where there is no neighbour).
+
+        numpy array object_ids - (N,) array with the object of every point,
+                                 only points on other objects are found
+                                 (unless all points are on one object)
+        float max_length       - only find points within this distance
+                                 (0 is no maximum)
+    """
+
+    points = numpy.asarray(points, dtype=numpy.float64)
+    count = len(points)
+    neighbours = numpy.full((count, k), -1, dtype=numpy.int64)
+    distances = numpy.full((count, k), numpy.inf)
+    if count < 2 or k < 1:
+        return neighbours, distances
+    if object_ids is None or len(numpy.unique(object_ids)) < 2:
+        # Every point is on its own, so only the point itself is left out
+        object_ids = numpy.arange(count)
+    _, object_indices = numpy.unique(object_ids, return_inverse=True)
+
+    size = min(k + 1, count)
+    tree = create_kd_tree(points)
+    found, lengths = query_kd_tree(tree, points, size)
+    other = ((found >= 0) &
+             (object_indices[found] != object_indices[:, numpy.newaxis]))
+    ranks = numpy.cumsum(other, axis=1)
+    done = (ranks[:, -1] >= k) | (size == count)
+    if max_length > 0:
+        # All points within max_length were found
+        done |= lengths[:, -1] > max_length
+    rows, columns = numpy.nonzero(other & (ranks <= k) & done[:, None])
+    neighbours[rows, ranks[rows, columns] - 1] = found[rows, columns]
+    distances[rows, ranks[rows, columns] - 1] = lengths[rows, columns]
+
+    pending = numpy.flatnonzero(~done)
+    if len(pending):
+        neighbours[pending], distances[pending] = query_other_objects(
+            points, object_indices, pending, k)
+
+    if max_length > 0:
+        distant = distances > max_length
+        neighbours[distant] = -1
+        distances[distant] = numpy.inf
+
+    return neighbours, distances
+
+
+def pick_neighbours(neighbours, start_indices, random_state):
+    """
+    pick_neighbours(numpy array neighbours, numpy array start_indices,
+                    CounterRandom random_state) -> numpy array end_indices
+
+        Picks a random one of the (found) nearest points (see find_nearest)
+        of every start index. The start points need at least one neighbour.
+    """
+
+    found = (neighbours >= 0).sum(axis=1)
+    ranks = (random_state.random_sample(len(start_indices)) *
+             found[start_indices]).astype(numpy.int64)
+
+    return neighbours[start_indices, ranks]
+
+
+def create_strands(start_points, end_points, point_count=3):
+    """
+    create_strands(numpy array start_points, numpy array end_points,
+                   int point_count) -> numpy array control_points
+
+        Returns the (N, P, 3) control points of straight strands between the
+        (N, 3) start and end points, with the P points evenly spaced.
+    """
+
+    start_points = numpy.asarray(start_points, dtype=numpy.float64)
+    end_points = numpy.asarray(end_points, dtype=numpy.float64)
+    factors = numpy.linspace(0, 1, point_count)[None, :, None]
+
+    return (start_points[:, None] +
+            (end_points - start_points)[:, None] * factors)
+
+
+def solve_catenary(spans, rises, lengths, iterations=16):
+    """
+    solve_catenary(numpy array spans, numpy array rises,
+                   numpy array lengths, int iterations)
+            -> numpy array parameters
+
+        Solves the parameter a of the catenaries y = a * cosh(x / a) with a
+        horizontal span, a vertical rise between the ends and a length, for
+        all (N,) strands at once. With u = span / 2a the length fixes
+        sinh(u) / u = r, with r = sqrt(length^2 - rise^2) / span, which is
+        solved with Newton's method. Both bounds sqrt(6 (r - 1)) and
+        ln(2r) + ln(ln(2r) + 1) + 1 are right of the root of the convex
+        sinh(u) - r u, so starting from the smallest one the iteration
+        converges monotonically. Strands without slack get an infinite
+        parameter (a straight line).
+    """
+
+    spans = numpy.asarray(spans, dtype=numpy.float64)
+    chords = numpy.sqrt(numpy.maximum(lengths ** 2 - rises ** 2, 0))
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        ratios = chords / spans
+    straight = ~(ratios > 1 + 1e-9)
+    ratios = numpy.where(straight, 2.0, numpy.minimum(ratios, 1e12))
+    log_ratios = numpy.log(2 * ratios)
+    u = numpy.minimum(numpy.sqrt(6 * (ratios - 1)),
+                      log_ratios + numpy.log(log_ratios + 1) + 1)
+    for _ in range(iterations):
+        u -= (numpy.sinh(u) - ratios * u) / (numpy.cosh(u) - ratios)
+    with numpy.errstate(divide='ignore'):
+        parameters = spans / (2 * u)
+    parameters[straight] = numpy.inf
+
+    return parameters
+
+
+def get_catenary_offsets(start_points, end_points, slacks, point_count=3):
+    """
+    get_catenary_offsets(numpy array start_points, numpy array end_points,
+                         numpy array slacks, int point_count)
+            -> numpy array offsets
+
+        Returns the (N, P) vertical offsets that make the evenly spaced
+        points of straight strands (see create_strands) hang as catenaries.
+        The length of every catenary is its slack times the distance
+        between its (N, 3) start and end point. Vertical strands can't sag
+        and stay straight.
+    """
+
+    start_points = numpy.asarray(start_points, dtype=numpy.float64)
+    end_points = numpy.asarray(end_points, dtype=numpy.float64)
+    vectors = end_points - start_points
+    spans = numpy.sqrt(vectors[:, 0] ** 2 + vectors[:, 1] ** 2)
+    rises = vectors[:, 2]
+    lengths = numpy.asarray(slacks) * numpy.sqrt(spans ** 2 + rises ** 2)
+    parameters = solve_catenary(spans, rises, lengths)
+    sagging = numpy.isfinite(parameters) & (spans > 0)
+
+    offsets = numpy.zeros((len(start_points), point_count))
+    a = parameters[sagging][:, None]
+    h = spans[sagging][:, None]
+    v = rises[sagging][:, None]
+    # The lowest point of the catenary lies at x0 from the start
+    x0 = h / 2 - a * numpy.arctanh(v / lengths[sagging][:, None])
+    x = h * numpy.linspace(0, 1, point_count)[None]
+    heights = a * (numpy.cosh((x - x0) / a) - numpy.cosh(x0 / a))
+    offsets[sagging] = heights - v * x / h
+
+    return offsets
+
+
+def apply_drapes(control_points, offsets):
+    """
+    apply_drapes(numpy array control_points, numpy array offsets)
+            -> numpy array drapes
+
+        Moves the points of the (N, P, 3) strands up by the (N, P) offsets,
+        in place. Returns the largest offset (by size) of every strand.
+    """
+
+    offsets = numpy.asarray(offsets)
+    control_points[..., 2] += offsets
+
+    return offsets[numpy.arange(len(offsets)),
+                   numpy.abs(offsets).argmax(axis=1)]
+
+
+def create_main_strands(buffer, points, iterations, random_state,
+                        object_ids=None, drape=None, max_strands=None,
+                        neighbours=0, max_length=0.0, collide=None,
+                        attempts=0):
+    """
+    create_main_strands(StrandBuffer buffer, numpy array points,
+                        int iterations, CounterRandom random_state,
+                        numpy array object_ids, function drape,
+                        int max_strands, int neighbours, float max_length,
+                        function collide, int attempts) -> range ids
+
+        Adds all main strands to the buffer at once (see iter_main_strands)
+        and returns their ids.
+    """
+
+    start = len(buffer)
+    for _ in iter_main_strands(buffer, points, iterations, random_state,
+                               object_ids=object_ids, drape=drape,
+                               max_strands=max_strands,
+                               neighbours=neighbours, max_length=max_length,
+                               collide=collide, attempts=attempts):
+        pass
+
+    return range(start, len(buffer))
+
+
+def iter_main_strands(buffer, points, iterations, random_state,
+                      object_ids=None, drape=None, max_strands=None,
+                      neighbours=0, max_length=0.0, collide=None,
+                      attempts=0, chunk_size=65536):
+    """
+    iter_main_strands(StrandBuffer buffer, numpy array points,
+                      int iterations, CounterRandom random_state,
+                      numpy array object_ids, function drape,
+                      int max_strands, int neighbours, float max_length,
+                      function collide, int attempts, int chunk_size)
+            -> generator
+
+        Connects every one of the (N, 3) points to <iterations> random
+        other points (see pair_indices), or to random ones of its nearest
+        points (see find_nearest), and adds the strands to the buffer in
+        chunks, the generator yields the ids of every added chunk.
+        Colliding strands are left out, or connected to another random
+        point up to <attempts> times. The random numbers of a strand only
+        depend on the random state, its position and the attempt (see
+        get_strand_keys), so the result doesn't depend on the chunk size.
+
+        numpy array object_ids - (N,) array with the object every point
+                                 was sampled from (stored as source ids)
+        function drape         - called with the control points of the
+                                 strands and a random generator for them,
+                                 returns the (N, P) offsets of their points
+                                 (see apply_drapes)
+        int max_strands        - the maximum number of strands to add
+                                 (None is no maximum)
+        int neighbours         - pick the other points from this many
+                                 nearest points on other objects (0 picks
+                                 from all points)
+        float max_length       - the maximum length of the strands to the
+                                 nearest points (0 is no maximum)
+        function collide       - called with the (draped) control points
+                                 of the strands and the (N, 2) objects they
+                                 hang from, returns an (N,) bool array with
+                                 the colliding strands
+        int attempts           - how many times colliding strands are
+                                 connected to another point
+        int chunk_size         - the maximum number of strands per chunk
+    """
+
+    points = numpy.asarray(points, dtype=numpy.float64)
+    attempt_random = random_state.stream(random_tools.STREAM_PAIRS, 0)
+    if neighbours > 0:
+        # Points without neighbours (within max_length) aren't connected
+        nearest, _ = find_nearest(points, neighbours, object_ids=object_ids,
+                                  max_length=max_length)
+        connected = numpy.flatnonzero((nearest >= 0).any(axis=1))
+        pair_count = len(connected) * iterations
+        if max_strands is not None:
+            pair_count = min(pair_count, max_strands)
+        pair_starts = connected[numpy.arange(pair_count) %
+                                max(len(connected), 1)]
+        pair_ends = pick_neighbours(nearest, pair_starts, attempt_random)
+    else:
+        pair_starts, pair_ends = pair_indices(len(points), iterations,
+                                              attempt_random,
+                                              max_pairs=max_strands)
+    if object_ids is None:
+        object_ids = numpy.full(len(points), -1, dtype=numpy.int64)
+    object_ids = numpy.asarray(object_ids)
+
+    for chunk_start in range(0, len(pair_starts), chunk_size):
+        positions = numpy.arange(chunk_start,
+                                 min(chunk_start + chunk_size,
+                                     len(pair_starts)))
+        start_indices = pair_starts[positions]
+        end_indices = pair_ends[positions]
+        kept = []
+        for attempt in range(attempts + 1):
+            control_points = create_strands(points[start_indices],
+                                            points[end_indices],
+                                            buffer.point_count)
+            keys = get_strand_keys(-1, attempt, positions)
+            drapes = numpy.zeros(len(control_points))
+            if drape is not None:
+                drape_random = random_state.stream(
+                    random_tools.STREAM_DRAPES).at(keys)
+                drapes = apply_drapes(control_points,
+                                      drape(control_points, drape_random))
+            if collide is None:
+                colliding = numpy.zeros(len(control_points),
+                                        dtype=numpy.bool_)
+            else:
+                colliding = collide(control_points,
+                                    numpy.column_stack((
+                                        object_ids[start_indices],
+                                        object_ids[end_indices])))
+            keep = ~colliding
+            kept.append((positions[keep], control_points[keep],
+                         drapes[keep], keys[keep], start_indices[keep],
+                         end_indices[keep]))
+            # Connect the colliding strands to other points
+            positions = positions[colliding]
+            start_indices = start_indices[colliding]
+            if not len(start_indices):
+                break
+            retry_random = random_state.stream(random_tools.STREAM_PAIRS,
+                                               attempt + 1).at(positions)
+            if neighbours > 0:
+                end_indices = pick_neighbours(nearest, start_indices,
+                                              retry_random)
+            else:
+                end_indices = ((start_indices +
+                                retry_random.randint(1, len(points),
+                                                     len(start_indices))) %
+                               len(points))
+
+        # Add the strands in the order of their positions
+        positions, control_points, drapes, keys, starts, ends = (
+            numpy.concatenate(arrays) for arrays in zip(*kept))
+        order = numpy.argsort(positions, kind='mergesort')
+        anchor_ids = numpy.column_stack((starts[order], ends[order]))
+        yield buffer.append(control_points[order],
+                            drapes=drapes[order],
+                            keys=keys[order],
+                            anchor_ids=anchor_ids,
+                            source_ids=object_ids[anchor_ids])
+
+
+def get_requested_count(main_count, iterations, include_sub=True):
+    """
+    get_requested_count(int main_count, int iterations, bool include_sub)
+            -> float count
+
+        Returns the total number of strands that <iterations> iterations of
+        sub strands on <main_count> main strands would create (see
+        iter_sub_strands), without creating them. Recursive sub strands grow
+        exponentially, so the count is a float (inf if it overflows).
+    """
+
+    if main_count < 2:
+        return float(main_count)
+    if not include_sub:
+        return float(main_count + iterations * ((main_count + 1) // 2))
+    count = float(main_count)
+    for _ in range(iterations):
+        count += math.ceil(count / 2)
+        if math.isinf(count):
+            break
+
+    return count
+
+
+def create_sub_strands(buffer, counters, random_state, strand_count=None):
+    """
+    create_sub_strands(StrandBuffer buffer, numpy array counters,
+                       CounterRandom random_state, int strand_count)
+            -> (numpy array control_points, numpy array parent_ids,
+                numpy array parameters)
+
+        Creates a strand for every counter, between random points on two
+        different random strands of the buffer. The random numbers of a
+        strand only depend on the random state and its counter. Only the
+        picked strands are read and evaluated, so the cost doesn't grow
+        with the size of the buffer. Returns the (N, P, 3) control points of
+        the new strands (not draped), the (N, 2) ids of the strands they
+        hang from and the (N, 2) positions on those strands.
+
+        int strand_count - only pick from the first <strand_count> strands
+                           (all strands by default)
+    """
+
+    amount = len(counters)
+    if strand_count is None:
+        strand_count = len(buffer)
+    if strand_count < 2 or amount < 1:
+        return (numpy.zeros((0, buffer.point_count, 3)),
+                numpy.zeros((0, 2), dtype=numpy.int64),
+                numpy.zeros((0, 2), dtype=numpy.float32))
+    # Every choice has its own stream
+    start_ids = random_state.stream(0).at(counters).randint(
+        0, strand_count, amount)
+    end_ids = (start_ids + random_state.stream(1).at(counters).randint(
+        1, strand_count, amount)) % strand_count
+    # Pick a random start and end point on the strands
+    # (as stored in the buffer, so drape_strands finds the same anchors)
+    parameters = numpy.column_stack((
+        random_state.stream(2).at(counters).triangular(0, 0.5, 1, amount),
+        random_state.stream(3).at(counters).triangular(0, 0.5, 1, amount)
+    )).astype(numpy.float32)
+    parent_ids = numpy.column_stack((start_ids, end_ids))
+
+    return (hang_strands(buffer.control_points, parent_ids, parameters,
+                         buffer.point_count),
+            parent_ids, parameters)
+
+
+def hang_strands(control_points, parent_ids, parameters, point_count=3):
+    """
+    hang_strands(numpy array control_points, numpy array parent_ids,
+                 numpy array parameters, int point_count)
+            -> numpy array control_points
+
+        Returns the (N, P, 3) control points of straight strands between
+        the points at the (N, 2) parameters on the (N, 2) parent strands.
+        The anchors are evaluated exactly on the parents, without
+        tessellating them.
+    """
+
+    start_points = curve_tools.get_points_on_splines(
+        control_points[parent_ids[:, 0]], parameters[:, 0])
+    end_points = curve_tools.get_points_on_splines(
+        control_points[parent_ids[:, 1]], parameters[:, 1])
+
+    return create_strands(start_points, end_points, point_count)
+
+
+def iter_sub_strands(buffer, iterations, random_state, include_sub=True,
+                     max_strands=None, max_bytes=None, chunk_size=65536,
+                     drape=None, collide=None, attempts=0):
+    """
+    iter_sub_strands(StrandBuffer buffer, int iterations,
+                     CounterRandom random_state, bool include_sub,
+                     int max_strands, int max_bytes, int chunk_size,
+                     function drape, function collide, int attempts)
+            -> generator
+
+        Adds <iterations> iterations of sub strands to the buffer, every
+        iteration half as many strands as it picks from (see
+        create_sub_strands). The strands are created and added in chunks,
+        the generator yields the ids of every added chunk. It stops when
+        the iterations are done, or as soon as the buffer holds
+        <max_strands> strands or <max_bytes> bytes. The random numbers of a
+        strand only depend on the random state, the iteration, the attempt
+        and its position in the iteration, so the result doesn't depend on
+        the chunk size.
+
+        bool include_sub   - also pick from the sub strands created so far
+                             (otherwise only from the strands in the buffer
+                             at the start)
+        int max_strands    - the maximum number of strands in the buffer
+                             (None is no maximum)
+        int max_bytes      - the maximum size of the buffer in bytes (None
+                             is no maximum)
+        int chunk_size     - the maximum number of strands per chunk
+        function drape     - called with the control points of every chunk
+                             and a random generator for them, returns the
+                             (N, P) offsets of their points (see
+                             apply_drapes)
+        function collide   - called with the (draped) control points of
+                             every chunk and the (N, 2) objects they hang
+                             from (all -1), returns an (N,) bool array with
+                             the colliding strands, which are left out
+        int attempts       - how many times colliding strands are replaced
+                             by new ones
+    """
+
+    main_count = len(buffer)
+    for iteration in range(iterations):
+        if include_sub:
+            strand_count = len(buffer)
+        else:
+            strand_count = main_count
+        if strand_count < 2:
+            return
+        amount = (strand_count + 1) // 2
+        done = 0
+        while done < amount:
+            size = min(amount - done, chunk_size)
+            if max_strands is not None:
+                size = min(size, max_strands - len(buffer))
+            if max_bytes is not None:
+                size = min(size,
+                           (max_bytes - buffer.nbytes) // buffer.strand_size)
+            if size < 1:
+                return
+            counters = numpy.arange(done, done + size)
+            kept = []
+            for attempt in range(attempts + 1):
+                attempt_random = random_state.stream(
+                    random_tools.STREAM_SUB_STRANDS, iteration, attempt)
+                control_points, parent_ids, parameters = create_sub_strands(
+                    buffer, counters, attempt_random,
+                    strand_count=strand_count)
+                keys = get_strand_keys(iteration, attempt, counters)
+                drapes = numpy.zeros(len(control_points))
+                if drape is not None:
+                    drape_random = random_state.stream(
+                        random_tools.STREAM_DRAPES).at(keys)
+                    drapes = apply_drapes(control_points,
+                                          drape(control_points,
+                                                drape_random))
+                if collide is None or not len(control_points):
+                    colliding = numpy.zeros(len(control_points),
+                                            dtype=numpy.bool_)
+                else:
+                    colliding = collide(control_points,
+                                        numpy.full((len(control_points), 2),
+                                                   -1, dtype=numpy.int64))
+                keep = ~colliding
+                kept.append((counters[keep], control_points[keep],
+                             drapes[keep], keys[keep], parent_ids[keep],
+                             parameters[keep]))
+                counters = counters[colliding]
+                if not len(counters):
+                    break
+            # Add the strands in the order of their positions
+            positions, control_points, drapes, keys, parent_ids, parameters = (
+                numpy.concatenate(arrays) for arrays in zip(*kept))
+            order = numpy.argsort(positions, kind='mergesort')
+            yield buffer.append(control_points[order],
+                                drapes=drapes[order],
+                                keys=keys[order],
+                                parent_ids=parent_ids[order],
+                                parameters=parameters[order])
+            done += size
+
+
+def drape_strands(buffer, points, random_state, drape=None):
+    """
+    drape_strands(StrandBuffer buffer, numpy array points,
+                  CounterRandom random_state, function drape)
+
+        Recreates the control points and drapes of all strands in the buffer
+        from its topology: the main strands between the (N, 3) points they
+        were created from, then every iteration of sub strands on their
+        (recreated) parents. With the random state and drape the strands were
+        created with, the result is the same, so only the drape can be
+        changed without creating the web again. Colliding strands aren't
+        rejected again.
+
+        function drape - called with the control points of the strands and
+                         a random generator for them, returns the (N, P)
+                         offsets of their points (see apply_drapes)
+    """
+
+    points = numpy.asarray(points, dtype=numpy.float64)
+    keys = buffer.keys
+    iterations = keys // 2 ** 40
+    drape_random = random_state.stream(random_tools.STREAM_DRAPES)
+    for iteration in numpy.unique(iterations):
+        ids = numpy.flatnonzero(iterations == iteration)
+        if iteration == 0:
+            anchor_ids = buffer.anchor_ids[ids]
+            control_points = create_strands(points[anchor_ids[:, 0]],
+                                            points[anchor_ids[:, 1]],
+                                            buffer.point_count)
+        else:
+            control_points = hang_strands(buffer.control_points,
+                                          buffer.parent_ids[ids],
+                                          buffer.parameters[ids],
+                                          buffer.point_count)
+        drapes = numpy.zeros(len(control_points))
+        if drape is not None:
+            drapes = apply_drapes(control_points,
+                                  drape(control_points,
+                                        drape_random.at(keys[ids])))
+        buffer.control_points[ids] = control_points
+        buffer.drapes[ids] = drapes